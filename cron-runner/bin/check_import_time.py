@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+
+from cron.settings_utils import get_scheduler_config
+
+# Libraries only the jobs need, importing the scheduler must not pull them in
+HEAVY_MODULES = [
+    "numpy",
+    "pandas",
+    "influxdb_client",
+    "discord",
+    "openmeteo_requests",
+    "openmeteo_sdk",
+    "requests_cache",
+    "pytz",
+]
+
+
+def measure_import(module: str) -> dict[str, int]:
+    """Import a module in a fresh interpreter and return the cumulative import time per module in µs."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")]))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, check=True)
+
+    import_times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        cumulative = cumulative.strip()
+        if cumulative.isdigit():
+            import_times[name.strip()] = int(cumulative)
+    return import_times
+
+
+def main():
+    budget_ms = get_scheduler_config()['import_budget_ms']
+    import_times = measure_import("cron.job_scheduler")
+
+    scheduler_ms = import_times.get("cron.job_scheduler", 0) / 1000
+    heavy_modules = [module for module in HEAVY_MODULES if module in import_times]
+
+    print(f"Importing cron.job_scheduler took {scheduler_ms:.1f} ms (budget {budget_ms:.1f} ms)")
+    failed = False
+    if scheduler_ms > budget_ms:
+        print("Import time budget exceeded, slowest imports:")
+        slowest = sorted(import_times.items(), key=lambda item: item[1], reverse=True)[:10]
+        for name, cumulative in slowest:
+            print(f"  {cumulative / 1000:8.1f} ms  {name}")
+        failed = True
+    if heavy_modules:
+        print(f"Importing the scheduler imports job libraries: {', '.join(heavy_modules)}")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,210 @@
-from datetime import datetime
-import pytz
+"""
+Convert the legacy run directories of the data directory to UTC.
+
+Legacy directories are named after the local (Europe/Berlin) time of the run
+and their "date" column holds the local wall time with a wrong "+00:00" offset.
+Every directory is copied to a new directory named after the UTC time of the run,
+with the dates converted to UTC. All other columns are copied unchanged.
+Directories that map to the same UTC directory are reported and left unconverted.
+
+    fix-time [workers=<processes>] [dry_run=true]
+"""
+import multiprocessing
 import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
 
+import numpy as np
 import pandas as pd
 
+from cron.jobs.toDataFrame import format_dates
 from cron.settings_utils import get_data_dir
 
+USAGE = "fix-time [workers=<processes>] [dry_run=true]"
 
-def main():
-    data_dir = get_data_dir()
-    directories = os.listdir(data_dir)
+LEGACY_FORMAT = "%Y-%m-%dT%H-%M-%S"
+RUN_FORMAT = "%Y-%m-%dT%H-%M-%SZ"
+TIMEZONE = "Europe/Berlin"
+# Files timed by a dry run to estimate the duration
+SAMPLE_FILES = 20
 
-    for directory in directories:
-        local_time = directory
+
+def parse_arguments(args: list[str]) -> dict:
+    arguments = {}
+    for arg in args:
+        if '=' not in arg:
+            raise ValueError(f"Argument '{arg}' not properly formatted, use: {USAGE}")
+        key, value = arg.split('=', 1)
+        arguments[key.lower()] = value
+    return arguments
+
+
+def to_utc_directory(directory: str) -> str:
+    """Name of the UTC directory of a legacy directory, ambiguous times are taken as standard time."""
+    local_time = pd.Timestamp(datetime.strptime(directory, LEGACY_FORMAT))
+    utc_time = local_time.tz_localize(TIMEZONE, ambiguous=False, nonexistent="shift_forward").tz_convert("UTC")
+    return utc_time.strftime(RUN_FORMAT)
+
+
+def local_dates_to_utc(dates: pd.Series) -> tuple[np.ndarray, int, np.ndarray]:
+    """
+    Convert local wall times to UTC strings.
+
+    The offset of the strings is ignored. When the clocks are turned back the hour
+    from 02:00 to 03:00 appears twice, the first occurrence is taken as summer time
+    and the repeated one as standard time. Wall times that do not exist because the
+    clocks were turned forward have no UTC time, shifting them would duplicate the
+    next valid time, so they are returned as a mask for the caller to drop.
+
+    Returns:
+        The UTC dates as "%Y-%m-%dT%H:%M:%SZ" strings, the number of ambiguous wall
+        times and a mask of the nonexistent ones
+    """
+    wall_times = pd.Series(pd.to_datetime(dates.str.slice(0, 19), format="%Y-%m-%d %H:%M:%S"))
+    # True for the first occurrence of a wall time, summer time if the wall time is ambiguous
+    summer_time = ~wall_times.duplicated(keep="first").to_numpy()
+
+    invalid = wall_times.dt.tz_localize(TIMEZONE, ambiguous="NaT", nonexistent="NaT").isna()
+    nonexistent = wall_times.dt.tz_localize(TIMEZONE, ambiguous=summer_time, nonexistent="NaT").isna()
+    utc = wall_times.dt.tz_localize(TIMEZONE, ambiguous=summer_time, nonexistent="NaT").dt.tz_convert("UTC")
+    ambiguous = invalid & ~nonexistent
+    return format_dates(utc), int(ambiguous.sum()), nonexistent.to_numpy()
+
+
+def count_rows(path: str) -> int:
+    with open(path, "rb") as f:
+        return max(f.read().count(b"\n") - 1, 0)
+
+
+def pending_files(data_dir: str, directory: str) -> tuple[str, list[str]]:
+    """The UTC directory of a legacy directory and the files that were not converted yet."""
+    target = to_utc_directory(directory)
+    files = sorted(os.listdir(os.path.join(data_dir, directory)))
+    return target, [file for file in files if not os.path.exists(os.path.join(data_dir, target, file))]
+
+
+def convert_file(source: str, target: str) -> tuple[int, int, int]:
+    """
+    Write the converted copy of a file, the file appears only once it is complete.
+
+    Rows with nonexistent wall times are dropped.
+
+    Returns:
+        The number of written rows, of ambiguous and of dropped nonexistent wall times
+    """
+    # Strings keep the values exactly as they were written
+    df = pd.read_csv(source, dtype=str, keep_default_na=False)
+    df["date"], ambiguous, nonexistent = local_dates_to_utc(df["date"])
+    df = df.loc[~nonexistent]
+    temporary = os.path.join(os.path.dirname(target), "." + os.path.basename(target) + ".tmp")
+    df.to_csv(temporary, index=False)
+    os.replace(temporary, target)
+    return len(df), ambiguous, int(nonexistent.sum())
+
+
+def convert_directory(data_dir: str, directory: str) -> tuple[str, str, int, int, int, int]:
+    """
+    Convert the files of a legacy directory that were not converted yet, runs in a worker process.
+
+    Returns:
+        The legacy and the UTC directory, the number of converted files, rows, ambiguous
+        and nonexistent wall times
+    """
+    target, files = pending_files(data_dir, directory)
+    os.makedirs(os.path.join(data_dir, target), exist_ok=True)
+    rows = ambiguous = nonexistent = 0
+    for file in files:
+        file_rows, file_ambiguous, file_nonexistent = convert_file(
+            os.path.join(data_dir, directory, file), os.path.join(data_dir, target, file))
+        rows += file_rows
+        ambiguous += file_ambiguous
+        nonexistent += file_nonexistent
+    return directory, target, len(files), rows, ambiguous, nonexistent
+
+
+def legacy_directories(data_dir: str) -> list[str]:
+    directories = []
+    for directory in sorted(os.listdir(data_dir)):
         try:
-            local_time = datetime.strptime(local_time, "%Y-%m-%dT%H-%M-%S")
+            datetime.strptime(directory, LEGACY_FORMAT)
         except ValueError:
-            print(f"Skipping query due to new date format: {local_time}")
+            print(f"Skipping query due to new date format: {directory}")
             continue
+        directories.append(directory)
+    return directories
+
+
+def without_collisions(directories: list[str]) -> list[str]:
+    """
+    Leave out the legacy directories that map to the same UTC directory as another one.
+
+    Their files would be merged into one run, the directories are reported to be
+    converted by hand.
+    """
+    by_target: dict[str, list[str]] = {}
+    for directory in directories:
+        by_target.setdefault(to_utc_directory(directory), []).append(directory)
+    for target, sources in by_target.items():
+        if len(sources) > 1:
+            print(f"Skipping {', '.join(sources)}: all of them map to {target}, convert them by hand")
+    return [directory for directory in directories if len(by_target[to_utc_directory(directory)]) == 1]
+
+
+def dry_run(data_dir: str, directories: list[str], workers: int) -> None:
+    """Report the files and rows that would be converted and estimate the duration of the run."""
+    files = rows = 0
+    pending = []
+    for directory in directories:
+        target, directory_files = pending_files(data_dir, directory)
+        for file in directory_files:
+            pending.append(os.path.join(data_dir, directory, file))
+            rows += count_rows(pending[-1])
+        files += len(directory_files)
+        if directory_files:
+            print(f">>> {directory} -> {target}: {len(directory_files)} files")
+
+    print(f"{files} files with {rows} rows in {len(directories)} directories would be converted")
+    if not pending:
+        return
+
+    # Time the conversion of a few files into a temporary directory
+    started = time.monotonic()
+    sample_rows = 0
+    with tempfile.TemporaryDirectory() as scratch:
+        for i, path in enumerate(pending[:SAMPLE_FILES]):
+            sample_rows += convert_file(path, os.path.join(scratch, f"{i}.csv"))[0]
+    seconds_per_row = (time.monotonic() - started) / max(sample_rows, 1)
+    print(f"Estimated duration with {workers} processes: {seconds_per_row * rows / workers:.0f} s")
+
+
+def main():
+    arguments = parse_arguments(sys.argv[1:])
+    workers = int(arguments.get('workers', os.cpu_count() or 1))
+    data_dir = get_data_dir()
+    directories = without_collisions(legacy_directories(data_dir))
 
-        berlin = pytz.timezone("Europe/Berlin")
-        local_time = berlin.localize(local_time)
-        utc_time = local_time.astimezone(pytz.utc)
+    if arguments.get('dry_run', 'false').lower() == 'true':
+        dry_run(data_dir, directories, workers)
+        return
 
-        os.mkdir(os.path.join(data_dir, utc_time.strftime("%Y-%m-%dT%H-%M-%SZ")))
+    started = time.monotonic()
+    files = rows = 0
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(convert_directory, data_dir, directory) for directory in directories]
+        for future in as_completed(futures):
+            directory, target, directory_files, directory_rows, ambiguous, nonexistent = future.result()
+            files += directory_files
+            rows += directory_rows
+            if directory_files == 0:
+                continue
+            print(f">>> Converted {directory_files} files from {directory} to {target}"
+                  + (f", {ambiguous} ambiguous wall times" if ambiguous else "")
+                  + (f", {nonexistent} rows with nonexistent wall times dropped" if nonexistent else ""))
 
-        models = os.listdir(os.path.join(data_dir, directory))
-        for model in models:
-            df = pd.read_csv(os.path.join(data_dir, directory, model))
-            df["date"] = df["date"].apply(lambda x: berlin.localize(datetime.strptime(
-                x, "%Y-%m-%d %H:%M:%S%z").replace(tzinfo=None)).astimezone(pytz.utc).strftime("%Y-%m-%dT%H:%M:%SZ"))
-            df.to_csv(os.path.join(data_dir, utc_time.strftime(
-                "%Y-%m-%dT%H-%M-%SZ"), model), index=False)
+    print(f"Converted {files} files with {rows} rows in {time.monotonic() - started:.1f} s")
 
 
 if __name__ == "__main__":
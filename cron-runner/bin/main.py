@@ -5,7 +5,10 @@ from cron.job_scheduler import JobScheduler
 def main():
     cron = JobScheduler()
     cron.apply_arguments(sys.argv)
-    cron.run()
+    if cron.daemon:
+        cron.run_daemon()
+    else:
+        cron.run()
 
 
 if __name__ == "__main__":
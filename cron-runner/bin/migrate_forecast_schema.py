@@ -0,0 +1,97 @@
+import sys
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+from influxdb_client.client.influxdb_client import InfluxDBClient
+from influxdb_client.domain.write_precision import WritePrecision
+
+from cron.jobs.clients import close_clients, get_influx_client
+from cron.jobs.influx_writer import get_influx_writer, close_influx_writer
+from cron.jobs.open_meteo.forecast_schema import ISSUE_TIME_MEASUREMENT, encode_lead_time
+from cron.settings_utils import get_influx_config
+
+USAGE = "migrate-forecast-schema start=YYYY-MM-DD [end=YYYY-MM-DD] [bucket=<target bucket>]"
+
+TAG_COLUMNS = ["model", "latitude", "longitude"]
+
+
+def parse_arguments(args: list[str]) -> dict:
+    arguments = {}
+    for arg in args:
+        if '=' not in arg:
+            raise ValueError(f"Argument '{arg}' not properly formatted, use: {USAGE}")
+        key, value = arg.split('=', 1)
+        arguments[key.lower()] = value
+    if 'start' not in arguments:
+        raise ValueError(f"Missing start date, use: {USAGE}")
+    return arguments
+
+
+def query_runs(client: InfluxDBClient, bucket: str, start: datetime, stop: datetime) -> pd.DataFrame:
+    """Query the forecasts of the runs in [start, stop) stored in the issue time schema, one row per forecasted date."""
+    query = f'''
+        from(bucket: "{bucket}")
+            |> range(start: {start.isoformat()}, stop: {stop.isoformat()})
+            |> filter(fn: (r) => r["_measurement"] == "{ISSUE_TIME_MEASUREMENT}")
+            |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+            |> drop(columns: ["_start", "_stop", "_measurement"])
+    '''
+    tables = client.query_api().query_data_frame(query)
+    if isinstance(tables, list):
+        tables = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+    return tables
+
+
+def migrate_runs(df: pd.DataFrame, bucket: str) -> int:
+    """Write the queried runs in the lead time schema, returns the number of written lines."""
+    writer = get_influx_writer()
+    fields = [column for column in df.columns
+              if column not in TAG_COLUMNS + ["_time", "forecast_date", "result", "table"]]
+    lines = 0
+    for (issue_time, model, latitude, longitude), run in df.groupby(
+            ["_time"] + TAG_COLUMNS, sort=False):
+        # The exact run time is kept as issue_time, lead_hour counts from its hour like the jobs write it
+        record = encode_lead_time(
+            {field: run[field].to_numpy(dtype=np.float64) for field in fields},
+            run["forecast_date"], issue_time,
+            tags={"model": model, "latitude": latitude, "longitude": longitude})
+        if record:
+            writer.write(bucket, record, WritePrecision.S)
+            lines += record.count(b"\n") + 1
+    return lines
+
+
+def main():
+    arguments = parse_arguments(sys.argv[1:])
+    influx_config = get_influx_config()
+    source_bucket = influx_config['bucket']
+    target_bucket = arguments.get('bucket', source_bucket)
+
+    start = datetime.strptime(arguments['start'], "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    end = datetime.strptime(arguments['end'], "%Y-%m-%d").replace(tzinfo=timezone.utc) \
+        if 'end' in arguments else datetime.now(timezone.utc)
+
+    client = get_influx_client()
+    print(f"Migrating forecasts from {start} to {end} into bucket {target_bucket}")
+    total_lines = 0
+    day = start
+    try:
+        # One day of runs per query keeps the pivoted frames small
+        while day < end:
+            stop = min(day + timedelta(days=1), end)
+            df = query_runs(client, source_bucket, day, stop)
+            lines = migrate_runs(df, target_bucket) if not df.empty else 0
+            total_lines += lines
+            print(">>> Migrated", lines, "lines for", day.strftime("%Y-%m-%d"))
+            day = stop
+    finally:
+        success = close_influx_writer()
+        close_clients()
+
+    print(f"Migrated {total_lines} lines" + ("" if success else ", some batches were spooled"))
+    print(f"The old points are kept, delete the measurement '{ISSUE_TIME_MEASUREMENT}' once the migration was checked")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,75 +1,242 @@
-from datetime import datetime
-import pytz
+import multiprocessing
 import os
-from pathlib import Path
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Optional
 
+import numpy as np
 import pandas as pd
-from influxdb_client.client.influxdb_client import InfluxDBClient
 from influxdb_client.domain.write_precision import WritePrecision
-from influxdb_client.client.write.point import Point
-from influxdb_client.client.write_api import SYNCHRONOUS
-
-from cron.settings_utils import get_data_dir, get_influx_config, get_coordinates
-
 
-def main():
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pandas parses the files without pyarrow
+    pa = None
+    pa_csv = None
+
+from cron.jobs.influx_writer import InfluxWriter, create_influx_writer, get_influx_writer, close_influx_writer
+from cron.jobs.line_protocol import encode_frame
+from cron.jobs.toDataFrame import format_dates
+from cron.settings_utils import get_data_dir, get_influx_config, get_locations, get_archive_config, get_state_dir
+
+USAGE = "transfer-csv-to-influx [workers=<processes>] [checkpoint=<file>] [restart=true]"
+
+RUN_FORMAT = "%Y-%m-%dT%H-%M-%SZ"
+
+
+def parse_arguments(args: list[str]) -> dict:
+    arguments = {}
+    for arg in args:
+        if '=' not in arg:
+            raise ValueError(f"Argument '{arg}' not properly formatted, use: {USAGE}")
+        key, value = arg.split('=', 1)
+        arguments[key.lower()] = value
+    return arguments
+
+
+def write_forecast(writer: InfluxWriter, bucket: str, utc_time: datetime, model_name: str,
+                   dates: np.ndarray, fields: pd.DataFrame, coordinates: tuple[float, float]) -> int:
+    """Encode the forecast of one model, location and run and hand it to the writer, returns the encoded bytes"""
+    latitude, longitude = coordinates
+    # Rows and fields without values are left out, this can happen if
+    # the forecast is too far in the future or the model does not
+    # provide data for a field
+    record = encode_frame(
+        "forecast",
+        fields.astype(np.float64),
+        tags={
+            "model": model_name,
+            "latitude": latitude,
+            "longitude": longitude,
+            "forecast_date": dates
+        },
+        time=utc_time,
+        precision=WritePrecision.S)
+
+    writer.write(bucket, record, WritePrecision.S)
+    return len(record)
+
+
+def location_coordinates() -> dict[str, tuple[float, float]]:
+    """Coordinates per location name, the default location under "" like its files in the run directory"""
+    return {"" if location['primary'] else location['name']: (location['latitude'], location['longitude'])
+            for location in get_locations()}
+
+
+def read_forecast_csv(path: str) -> pd.DataFrame:
+    """
+    Read a forecast file with typed columns: the dates as strings, all fields as float32.
+
+    The files hold the float32 values of the responses, parsed as float32 the
+    values are the same the InfluxDB job writes.
+    """
+    with open(path) as f:
+        columns = f.readline().strip().split(",")
+    if pa_csv is not None:
+        column_types = {column: pa.string() if column == "date" else pa.float32() for column in columns}
+        table = pa_csv.read_csv(path, convert_options=pa_csv.ConvertOptions(column_types=column_types))
+        return table.to_pandas()
+    return pd.read_csv(path, dtype={column: str if column == "date" else np.float32 for column in columns})
+
+
+class Checkpoint:
+    """
+    Completed (directory, model) pairs of a backfill, appended to a text file
+    once their points were written, so a new run skips them. Models of other
+    locations than the default one are stored as "<location>/<model>".
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self.completed: set[tuple[str, str]] = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    directory, _, model = line.rstrip("\n").partition("\t")
+                    if model:
+                        self.completed.add((directory, model))
+
+    def add(self, directory: str, models: list[str]) -> None:
+        os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+        with open(self._path, "a") as f:
+            f.writelines(f"{directory}\t{model}\n" for model in models)
+        self.completed.update((directory, model) for model in models)
+
+
+# Writer of a worker process, created by _init_worker
+_worker_writer: Optional[InfluxWriter] = None
+
+
+def _init_worker() -> None:
+    global _worker_writer
+    # The spool is replayed once by the main process, not by every worker
+    _worker_writer = create_influx_writer()
+
+
+def transfer_directory(data_dir: str, directory: str, bucket: str, models: list[str],
+                       coordinates: dict[str, tuple[float, float]]) -> tuple[str, list[str], int, int]:
+    """
+    Write the forecasts of the given models of one run directory, runs in a worker process.
+
+    Returns:
+        The directory, the models that were written, the number of rows and of encoded bytes
+    """
+    utc_time = datetime.strptime(directory, RUN_FORMAT)
+    rows = encoded_bytes = 0
+    for model in models:
+        location, _, model_name = model.rpartition("/")
+        df = read_forecast_csv(os.path.join(data_dir, directory, f"{model}.csv"))
+        encoded_bytes += write_forecast(_worker_writer, bucket, utc_time, model_name,
+                                        df["date"].to_numpy(), df.drop(columns="date"), coordinates[location])
+        rows += len(df)
+    if not _worker_writer.flush():
+        # The points were spooled and are written by the next run, write them again
+        # instead of checkpointing them
+        return directory, [], rows, encoded_bytes
+    return directory, models, rows, encoded_bytes
+
+
+def _run_models(run_directory: str, coordinates: dict[str, tuple[float, float]]) -> list[str]:
+    """Files of a run directory, the models of other locations are in a subdirectory per location"""
+    models = []
+    for entry in sorted(os.listdir(run_directory)):
+        path = os.path.join(run_directory, entry)
+        if entry.endswith(".csv"):
+            models.append(os.path.splitext(entry)[0])
+        elif os.path.isdir(path):
+            if entry not in coordinates:
+                print(f"Skipping unknown location {entry} in {run_directory}")
+                continue
+            models.extend(f"{entry}/{os.path.splitext(file)[0]}"
+                          for file in sorted(os.listdir(path)) if file.endswith(".csv"))
+    return models
+
+
+def transfer_csv(bucket: str, workers: int, checkpoint: Checkpoint) -> None:
+    """Write all run directories of the data directory, one directory per task of a process pool."""
     data_dir = get_data_dir()
-    influx_config = get_influx_config()
-    latitude, longitude = get_coordinates()
-
-    directories = os.listdir(data_dir)
-
-    client = InfluxDBClient(
-        url=influx_config['url'],
-        token=influx_config['token'],
-        org=influx_config['org']
-    )
-    write_api = client.write_api(write_options=SYNCHRONOUS)
-
-    for directory in directories:
-        utc_time = directory
+    coordinates = location_coordinates()
+    tasks = []
+    skipped = 0
+    for directory in sorted(os.listdir(data_dir)):
         try:
-            utc_time = datetime.strptime(utc_time, "%Y-%m-%dT%H-%M-%SZ")
+            datetime.strptime(directory, RUN_FORMAT)
         except ValueError:
-            print(f"Skipping query due to old date format: {utc_time}")
+            print(f"Skipping query due to old date format: {directory}")
             continue
 
-        models = os.listdir(os.path.join(data_dir, directory))
-        for model in models:
-            df = pd.read_csv(os.path.join(data_dir, directory, model))
-            influx_data = []
-            model_name = Path(model).stem
-
-            for index, row in df.iterrows():
-                point = Point("forecast")
-                point.time(utc_time, WritePrecision.S)
-                point.tag("model", model_name)
-                point.tag("latitude", latitude)
-                point.tag("longitude", longitude)
-                point.tag("forecast_date", row["date"])
-
-                row = row.drop("date")
-
-                is_nan = row.isna()
-                if is_nan.sum() == len(row):
-                    # if all values are NaN, skip this row
-                    # this can happen if the forecast is too far in the future
-                    # and the model does not provide data yet
-                    continue
-
-                for key, value in row.items():
-                    if pd.isna(value):
-                        # skip NaN values
-                        # this can happen if the model does not provide data for this field
-                        continue
-                    point.field(key, value)
-
-                influx_data.append(point)
-
-            write_api.write(
-                bucket=influx_config['bucket'], org="FogCast", record=influx_data)
-        print(">>> Wrote", len(models), "models for", directory)
-    write_api.close()
+        models = _run_models(os.path.join(data_dir, directory), coordinates)
+        remaining = [model for model in models if (directory, model) not in checkpoint.completed]
+        skipped += len(models) - len(remaining)
+        if remaining:
+            tasks.append((directory, remaining))
+
+    print(f"Transferring {len(tasks)} directories with {workers} processes, "
+          f"skipping {skipped} models that were already written")
+    started = time.monotonic()
+    total_rows = total_bytes = 0
+    # spawn: every worker creates its own InfluxDB client
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker) as executor:
+        futures = [executor.submit(transfer_directory, data_dir, directory, bucket, models, coordinates)
+                   for directory, models in tasks]
+        for done, future in enumerate(as_completed(futures), start=1):
+            directory, models, rows, encoded_bytes = future.result()
+            checkpoint.add(directory, models)
+            total_rows += rows
+            total_bytes += encoded_bytes
+            elapsed = max(time.monotonic() - started, 1e-9)
+            print(f">>> Wrote {len(models)} models for {directory} ({done}/{len(tasks)}), "
+                  f"{total_rows / elapsed:,.0f} rows/s, {total_bytes / elapsed / 2**20:.1f} MB/s")
+
+    elapsed = time.monotonic() - started
+    print(f"Transferred {total_rows:,} rows ({total_bytes / 2**20:.1f} MB of line protocol) in {elapsed:.1f} s")
+
+
+def transfer_archive(writer: InfluxWriter, bucket: str, archive_config: dict) -> None:
+    from cron.jobs.open_meteo.forecast_archive import iter_archive_runs
+
+    locations = get_locations()
+    default_location = locations[0]['name']
+    coordinates = {location['name']: (location['latitude'], location['longitude']) for location in locations}
+    for utc_time, df in iter_archive_runs(archive_config['archive_dir'], archive_config['format']):
+        fields = df.columns.difference(["issue_time", "location", "model", "date", "issue_date"], sort=False)
+        # Runs archived before there were several locations are for the default location
+        run_locations = df["location"].astype(object).fillna(default_location) if "location" in df \
+            else pd.Series(default_location, index=df.index)
+        models = 0
+        for (location, model_name), model_df in df.groupby([run_locations, df["model"].astype(str)], sort=False):
+            if location not in coordinates:
+                print(f"Skipping unknown location {location} of {model_name}")
+                continue
+            write_forecast(writer, bucket, utc_time, model_name,
+                           format_dates(model_df["date"]), model_df[fields], coordinates[location])
+            models += 1
+        print(">>> Wrote", models, "models for", utc_time.strftime("%Y-%m-%dT%H-%M-%SZ"))
+
+
+def main():
+    arguments = parse_arguments(sys.argv[1:])
+    influx_config = get_influx_config()
+    archive_config = get_archive_config()
+
+    # Writes the records spooled by earlier runs
+    writer = get_influx_writer()
+
+    if archive_config['format'] != 'csv':
+        transfer_archive(writer, influx_config['bucket'], archive_config)
+        close_influx_writer()
+        return
+    close_influx_writer()
+
+    checkpoint_path = arguments.get('checkpoint', os.path.join(get_state_dir(), "transfer_checkpoint.txt"))
+    if arguments.get('restart', 'false').lower() == 'true' and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    workers = int(arguments.get('workers', os.cpu_count() or 1))
+    transfer_csv(influx_config['bucket'], workers, Checkpoint(checkpoint_path))
 
 
 if __name__ == "__main__":
@@ -1,16 +1,21 @@
+from __future__ import annotations
+
+import importlib
 import os
 import logging
+import queue
+import signal
+import sys
+import threading
+import time
 from datetime import datetime, timezone
-from typing import List, Type, Optional, Dict
+from typing import TYPE_CHECKING, List, Type, Optional, Dict, Tuple
 
-from discord import SyncWebhook
+from cron.settings_utils import get_log_dir, get_discord_webhook_url, get_scheduler_config
 
-from cron.jobs.cronjob_base import CronjobBase
-from cron.jobs.open_meteo.open_meteo_csv_cronjob import OpenMeteoCsvCronjob
-from cron.jobs.open_meteo.open_meteo_influx_cronjob import OpenMeteoInfluxCronjob
-from cron.jobs.water_level.pegel_online_cronjob import PegelOnlineCronjob
-from cron.jobs.model_benchmarking.benchmarking_cronjob import BenchmarkingCronjob
-from cron.settings_utils import get_log_dir, get_discord_webhook_url
+if TYPE_CHECKING:
+    from discord import SyncWebhook
+    from cron.jobs.cronjob_base import CronjobBase
 
 
 # Constants
@@ -37,22 +42,35 @@ class JobScheduler:
     - 5: Every 5 minutes
     - 60: Every hour
     - 1440: Every day
+
+    Jobs of a run are executed concurrently by a pool of worker threads. A job
+    starts once the jobs named in its `dependencies` are finished, is skipped
+    when one of them failed or timed out, and is cancelled when it runs longer
+    than its `timeout`.
+
+    The scheduler either executes the jobs due at the current time once (started
+    by crond) or keeps running as a daemon that fires the intervals itself.
+
+    Jobs are registered by their dotted path. A job module, and with it the libraries
+    the job needs, is only imported when the job is selected to run.
     """
     
     # Job configuration organized by interval (in minutes)
-    _job_config: Dict[int, List[Type[CronjobBase]]] = {
+    _job_config: Dict[int, List[str]] = {
         MINUTES_5: [
             # Jobs that run every 5 minutes
         ],
         MINUTES_60: [
             # Jobs that run every hour
-            OpenMeteoCsvCronjob,
-            OpenMeteoInfluxCronjob,
-            BenchmarkingCronjob
+            'cron.jobs.open_meteo.open_meteo_csv_cronjob.OpenMeteoCsvCronjob',
+            'cron.jobs.open_meteo.open_meteo_influx_cronjob.OpenMeteoInfluxCronjob',
+            'cron.jobs.model_benchmarking.benchmarking_cronjob.BenchmarkingCronjob'
         ],
         MINUTES_1440: [
             # Jobs that run daily
-            PegelOnlineCronjob,
+            'cron.jobs.water_level.pegel_online_cronjob.PegelOnlineCronjob',
+            # Probes the fields of the models once the matrix is older than field_availability.refresh_days
+            'cron.jobs.open_meteo.field_availability_cronjob.FieldAvailabilityCronjob',
         ],
     }
 
@@ -61,16 +79,39 @@ class JobScheduler:
         self._logger = logging.getLogger(__name__)
         self._run_single_job_now: Optional[str] = None
         self._webhook = self._initialize_webhook()
+        scheduler_config = get_scheduler_config()
+        self._max_workers = max(1, scheduler_config['max_workers'])
+        self._job_timeout = scheduler_config['job_timeout']
+        self._cancel_grace = scheduler_config['cancel_grace']
+        # Instances of the running jobs, used to cancel them after a timeout
+        self._job_instances: Dict[str, CronjobBase] = {}
+        # Names of the jobs whose thread is still alive, a job never runs twice at the same time
+        self._running_jobs: set = set()
+        self._running_jobs_lock = threading.Lock()
+        # Threads of cancelled jobs, waited for before the shared InfluxDB writer is closed
+        self._cancelled_threads: List[threading.Thread] = []
+        self._daemon = False
+        # Job instances kept between the runs of the daemon
+        self._instance_cache: Dict[str, CronjobBase] = {}
+        self._stop = threading.Event()
 
     def _initialize_webhook(self) -> Optional[SyncWebhook]:
         """Initialize Discord webhook if URL is configured."""
         try:
             webhook_url = get_discord_webhook_url()
-            return SyncWebhook.from_url(webhook_url) if webhook_url else None
+            if not webhook_url:
+                return None
+            from discord import SyncWebhook
+            return SyncWebhook.from_url(webhook_url)
         except Exception as e:
             self._logger.warning(f"Failed to initialize Discord webhook: {e}")
             return None
 
+    @property
+    def daemon(self) -> bool:
+        """Whether the scheduler was configured to run as a daemon."""
+        return self._daemon
+
     def run(self) -> None:
         """Main entry point to run scheduled jobs."""
         try:
@@ -84,6 +125,114 @@ class JobScheduler:
         except Exception as e:
             self._logger.exception('Critical error in cron scheduler logic')
             raise
+        finally:
+            self._wait_for_cancelled_jobs()
+            self._report_cache_stats()
+            self._close_influx_writer()
+
+    def run_daemon(self) -> None:
+        """
+        Keep the scheduler running and fire the job intervals on a monotonic timer.
+
+        Every interval is aligned to the wall clock once (e.g. the full hour for 60 minutes)
+        and then fires every interval minutes. The jobs of a run are executed in the
+        background, so a long running hourly run does not delay the 5 minute jobs. Job
+        instances, and with them their clients and configuration, are kept between runs.
+        """
+        self._logger.info('## Cron daemon started')
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: self.stop())
+
+        next_runs = {interval: self._get_first_run(interval)
+                     for interval, job_list in self._job_config.items() if job_list}
+        runs: List[threading.Thread] = []
+        while next_runs and not self._stop.is_set():
+            now = time.monotonic()
+            due = [interval for interval, next_run in next_runs.items() if next_run <= now]
+            if due:
+                for interval in due:
+                    # Skip intervals that were missed, e.g. after the system was suspended
+                    while next_runs[interval] <= now:
+                        next_runs[interval] += interval * 60
+                job_paths = []
+                for interval in sorted(due):
+                    job_paths.extend(path for path in self._job_config[interval] if path not in job_paths)
+                run = threading.Thread(target=self._run_daemon_jobs, args=(job_paths,), name='cron-run')
+                run.start()
+                runs = [r for r in runs if r.is_alive()] + [run]
+
+            self._stop.wait(max(0.0, min(next_runs.values()) - time.monotonic()))
+
+        self._logger.info('## Cron daemon stopping, waiting for running jobs')
+        for run in runs:
+            run.join()
+        self._wait_for_cancelled_jobs()
+        self._close_influx_writer()
+
+    def stop(self) -> None:
+        """Stop the daemon after the running jobs are finished."""
+        self._stop.set()
+
+    def _run_daemon_jobs(self, job_paths: List[str]) -> None:
+        """Execute the jobs of a daemon run and write their buffered records."""
+        try:
+            self._logger.info('## Cron scheduler started')
+            current_time = datetime.now(timezone.utc).astimezone()
+            self._logger.info(f'Current time: hour={current_time.hour}, minute={current_time.minute}')
+            self._execute_jobs(self._load_jobs(job_paths), current_time)
+        except Exception:
+            self._logger.exception('Critical error in cron scheduler logic')
+        finally:
+            try:
+                if not self._flush_influx_writer():
+                    self._logger.warning('Some records could not be written to InfluxDB and were spooled')
+            except Exception as e:
+                self._logger.exception(f'Failed to flush InfluxDB writer: {e}')
+            self._report_cache_stats()
+
+    @staticmethod
+    def _get_first_run(interval_minutes: int) -> float:
+        """Get the monotonic time of the next wall clock time that is a multiple of the interval."""
+        now = datetime.now(timezone.utc).astimezone()
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        seconds_since_midnight = (now - midnight).total_seconds()
+        interval_seconds = interval_minutes * 60
+        wait_seconds = interval_seconds - seconds_since_midnight % interval_seconds
+        return time.monotonic() + wait_seconds
+
+    # The writer and the shared clients are only imported by the jobs that use them,
+    # the scheduler must not import them (and with them the InfluxDB client) itself
+
+    @staticmethod
+    def _flush_influx_writer() -> bool:
+        """Write the records buffered by the shared InfluxDB writer if a job of this process used it."""
+        if 'cron.jobs.influx_writer' not in sys.modules:
+            return True
+        from cron.jobs.influx_writer import flush_influx_writer
+        return flush_influx_writer()
+
+    def _close_influx_writer(self) -> None:
+        """Write the records still buffered by the jobs of this run and close the shared clients."""
+        if 'cron.jobs.influx_writer' in sys.modules:
+            from cron.jobs.influx_writer import close_influx_writer
+            try:
+                if not close_influx_writer():
+                    self._logger.warning('Some records could not be written to InfluxDB and were spooled')
+            except Exception as e:
+                self._logger.exception(f'Failed to close InfluxDB writer: {e}')
+        if 'cron.jobs.clients' in sys.modules:
+            from cron.jobs.clients import close_clients
+            try:
+                close_clients()
+            except Exception as e:
+                self._logger.exception(f'Failed to close shared clients: {e}')
+
+    @staticmethod
+    def _report_cache_stats() -> None:
+        """Log the HTTP cache hit rates of this run if a job of this process used the shared session."""
+        if 'cron.jobs.clients' in sys.modules:
+            from cron.jobs.clients import report_cache_stats
+            report_cache_stats()
 
     def _get_jobs_to_run(self, current_time: datetime) -> List[Type[CronjobBase]]:
         """Determine which jobs should run based on current time or manual override."""
@@ -91,25 +240,135 @@ class JobScheduler:
             return self._get_single_job()
         return self._get_scheduled_jobs(current_time)
 
+    def _wait_for_cancelled_jobs(self) -> None:
+        """Give cancelled jobs that are still running scheduler.cancel_grace seconds to stop."""
+        deadline = time.monotonic() + self._cancel_grace
+        for thread in self._cancelled_threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+            if thread.is_alive():
+                self._logger.warning(f'Cancelled job still running after {self._cancel_grace}s: {thread.name}')
+        self._cancelled_threads = [thread for thread in self._cancelled_threads if thread.is_alive()]
+
     def _execute_jobs(self, jobs: List[Type[CronjobBase]], current_time: datetime) -> None:
-        """Execute a list of jobs."""
-        for job_class in jobs:
-            self._execute_single_job(job_class, current_time)
+        """Execute a list of jobs concurrently, respecting their dependencies and timeouts."""
+        pending = list(jobs)
+        job_names = {job_class.__name__ for job_class in jobs}
+        finished: set = set()
+        # Jobs that failed or timed out, the jobs depending on them are skipped
+        failed: set = set()
+        # Running jobs by name with their deadline and thread
+        running: Dict[str, Tuple[Type[CronjobBase], float, threading.Thread]] = {}
+        done_queue: queue.Queue = queue.Queue()
 
-    def _execute_single_job(self, job_class: Type[CronjobBase], current_time: datetime) -> None:
-        """Execute a single job with proper error handling and logging."""
+        def run_job(job_class: Type[CronjobBase]) -> None:
+            success = False
+            try:
+                success = self._execute_single_job(job_class, current_time)
+            finally:
+                with self._running_jobs_lock:
+                    self._running_jobs.discard(job_class.__name__)
+                done_queue.put((job_class.__name__, success))
+
+        with self._running_jobs_lock:
+            for job_class in list(pending):
+                if job_class.__name__ in self._running_jobs:
+                    self._logger.warning(f'Job skipped, previous run still running: {job_class.__name__}')
+                    pending.remove(job_class)
+                    job_names.discard(job_class.__name__)
+                else:
+                    self._running_jobs.add(job_class.__name__)
+
+        while pending or running:
+            self._skip_dependent_jobs(pending, failed)
+            if not pending and not running:
+                break
+            ready = self._get_ready_jobs(pending, job_names, finished, bool(running))
+            for job_class in ready[:max(0, self._max_workers - len(running))]:
+                pending.remove(job_class)
+                timeout = job_class.timeout if job_class.timeout is not None else self._job_timeout
+                # Daemon threads, a job that hangs after its timeout must not block the process from exiting
+                thread = threading.Thread(target=run_job, args=(job_class,),
+                                          name=f'cronjob-{job_class.__name__}', daemon=True)
+                running[job_class.__name__] = (job_class, time.monotonic() + timeout, thread)
+                thread.start()
+
+            next_deadline = min(deadline for _, deadline, _ in running.values())
+            try:
+                job_name, success = done_queue.get(timeout=max(0.0, next_deadline - time.monotonic()))
+                if job_name in running:
+                    del running[job_name]
+                    (finished if success else failed).add(job_name)
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            for job_name, (job_class, deadline, thread) in list(running.items()):
+                if deadline <= now:
+                    del running[job_name]
+                    failed.add(job_name)
+                    self._cancelled_threads.append(thread)
+                    self._handle_job_timeout(job_class)
+
+    def _skip_dependent_jobs(self, pending: List[Type[CronjobBase]], failed: set) -> None:
+        """Skip the pending jobs that depend on a failed or timed out job, and the jobs depending on those."""
+        skipped = True
+        while skipped:
+            skipped = [job_class for job_class in pending
+                       if any(dependency in failed for dependency in job_class.dependencies)]
+            for job_class in skipped:
+                job_name = job_class.__name__
+                pending.remove(job_class)
+                failed.add(job_name)
+                with self._running_jobs_lock:
+                    self._running_jobs.discard(job_name)
+                dependencies = [dependency for dependency in job_class.dependencies if dependency in failed]
+                message = f'Job skipped, dependencies failed: {job_name} (depends on {", ".join(dependencies)})'
+                self._logger.warning(message)
+                print(message)
+                self._send_warning_notification(job_name, f'Skipped, dependencies failed: {", ".join(dependencies)}')
+
+    def _get_ready_jobs(self, pending: List[Type[CronjobBase]], job_names: set, finished: set,
+                        jobs_running: bool) -> List[Type[CronjobBase]]:
+        """Get the pending jobs whose dependencies of this run are finished."""
+        ready = [job_class for job_class in pending
+                 if all(dependency in finished or dependency not in job_names
+                        for dependency in job_class.dependencies)]
+        if not ready and pending and not jobs_running:
+            # Nothing can finish anymore, the dependencies are circular
+            self._logger.error(
+                f"Circular job dependencies, starting remaining jobs: {[job.__name__ for job in pending]}")
+            return list(pending)
+        return ready
+
+    def _handle_job_timeout(self, job_class: Type[CronjobBase]) -> None:
+        """Cancel a job that exceeded its timeout."""
+        job_name = job_class.__name__
+        job_instance = self._job_instances.get(job_name)
+        if job_instance:
+            job_instance.cancel()
+        timeout = job_class.timeout if job_class.timeout is not None else self._job_timeout
+        self._handle_job_error(job_name, TimeoutError(f'Job exceeded its timeout of {timeout}s'), job_instance)
+
+    def _execute_single_job(self, job_class: Type[CronjobBase], current_time: datetime) -> bool:
+        """Execute a single job with proper error handling and logging, returns False if it failed."""
         job_name = job_class.__name__
         start_time = self._get_timestamp()
         
         try:
             self._logger.info(f'Checking job: {job_name}')
-            job_instance = job_class()
+            job_instance = self._get_job_instance(job_class)
+            self._job_instances[job_name] = job_instance
             
             should_run = job_instance.shouldStart(current_time) or self._run_single_job_now is not None
             
             if should_run:
                 self._logger.info(f'Starting job: {job_name}')
                 success = job_instance.start(current_time)
+
+                if job_instance.isCancelled():
+                    # Timeout and cleanup were already handled by the scheduler
+                    self._logger.warning(f'Job finished after it was cancelled: {job_name}')
+                    return False
                 
                 if not success:
                     self._logger.warning(f'Job controlled termination: {job_name}')
@@ -117,12 +376,31 @@ class JobScheduler:
                 
                 execution_time = self._get_timestamp() - start_time
                 self._logger.info(f'Job completed: {job_name}, execution time: {execution_time}s')
+                return bool(success)
             else:
                 execution_time = self._get_timestamp() - start_time
                 self._logger.info(f'Job skipped: {job_name}, check time: {execution_time}s')
+                return True
                 
         except Exception as e:
+            if 'job_instance' in locals() and job_instance.isCancelled():
+                self._logger.warning(f'Job failed after it was cancelled: {job_name}')
+                return False
             self._handle_job_error(job_name, e, job_instance if 'job_instance' in locals() else None)
+            return False
+        finally:
+            self._job_instances.pop(job_name, None)
+
+    def _get_job_instance(self, job_class: Type[CronjobBase]) -> CronjobBase:
+        """Create a job instance, the daemon reuses instances that were not cancelled."""
+        if not self._daemon:
+            return job_class()
+
+        job_instance = self._instance_cache.get(job_class.__name__)
+        if job_instance is None or job_instance.isCancelled():
+            job_instance = job_class()
+            self._instance_cache[job_class.__name__] = job_instance
+        return job_instance
 
     def _handle_job_error(self, job_name: str, error: Exception, job_instance: Optional[CronjobBase]) -> None:
         """Handle job execution errors with logging and notification."""
@@ -158,35 +436,62 @@ class JobScheduler:
         except Exception as webhook_error:
             self._logger.error(f'Failed to send Discord notification: {webhook_error}')
 
+    def _send_warning_notification(self, job_name: str, warning: str) -> None:
+        """Send warning notification via Discord webhook."""
+        if not self._webhook:
+            return
+
+        try:
+            warning_message = (
+                f"**⚠️ Cronjob Warning**\n"
+                f"**Time:** `{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}`\n"
+                f"**Job:** `{job_name}`\n"
+                f"**{warning}**"
+            )
+            self._webhook.send(warning_message)
+        except Exception as webhook_error:
+            self._logger.error(f'Failed to send Discord notification: {webhook_error}')
 
     def _get_scheduled_jobs(self, current_time: datetime) -> List[Type[CronjobBase]]:
         """Get jobs that should run based on current time."""
-        jobs_to_run = []
+        # Minutes since midnight, like the daemon aligns the intervals, so the daily jobs only run at 00:00
+        minute_of_day = current_time.hour * 60 + current_time.minute
+        job_paths = []
         for interval_minutes, job_list in self._job_config.items():
-            if current_time.minute % interval_minutes == 0:
-                jobs_to_run.extend(job_list)
-        return jobs_to_run
+            if minute_of_day % interval_minutes == 0:
+                job_paths.extend(job_list)
+        return self._load_jobs(job_paths)
 
-    def _get_all_jobs(self) -> List[Type[CronjobBase]]:
-        """Get all configured jobs."""
-        all_jobs = []
+    def _get_all_job_paths(self) -> List[str]:
+        """Get the paths of all configured jobs."""
+        all_job_paths = []
         for job_list in self._job_config.values():
-            all_jobs.extend(job_list)
-        return all_jobs
+            all_job_paths.extend(job_list)
+        return all_job_paths
 
     def _get_single_job(self) -> List[Type[CronjobBase]]:
         """Get a single job to run (used for manual execution)."""
         if not self._run_single_job_now:
             return []
         
-        all_jobs = self._get_all_jobs()
-        for job_class in all_jobs:
-            if job_class.__name__ == self._run_single_job_now:
-                return [job_class]
+        for job_path in self._get_all_job_paths():
+            if job_path.rsplit('.', 1)[-1] == self._run_single_job_now:
+                return self._load_jobs([job_path])
         
         self._logger.error(f"Job '{self._run_single_job_now}' not found!")
         return []
 
+    @staticmethod
+    def _load_jobs(job_paths: List[str]) -> List[Type[CronjobBase]]:
+        """Import the job classes of the given dotted paths."""
+        jobs = []
+        for job_path in job_paths:
+            module_name, class_name = job_path.rsplit('.', 1)
+            job_class = getattr(importlib.import_module(module_name), class_name)
+            if job_class not in jobs:
+                jobs.append(job_class)
+        return jobs
+
     @staticmethod
     def _get_timestamp() -> int:
         """Get current timestamp as integer."""
@@ -216,6 +521,12 @@ class JobScheduler:
             self._logger.info(f"Dummy parameter detected, value: '{value}'. Nothing to do.")
         elif key == "run_single_job_now":
             self._run_single_job_now = value
+        elif key == "mode":
+            if value not in ("once", "daemon"):
+                error_msg = f"Unknown mode: {value}, use 'once' or 'daemon'"
+                self._logger.error(error_msg)
+                raise ValueError(error_msg)
+            self._daemon = value == "daemon"
         else:
             error_msg = f"Unknown argument key: {key}"
             self._logger.error(error_msg)
@@ -0,0 +1,190 @@
+"""
+Shared HTTP and InfluxDB clients of the cron jobs.
+
+All HTTP requests go through one session per process, so the keep-alive
+connections of its pool are reused by every job of a run and, in the daemon,
+across runs. Responses are cached in a configurable backend (`http.cache_backend`):
+
+    memory      in-process LRU cache of `http.memory_max_entries` responses
+    sqlite      one sqlite file in `http.cache_dir`
+    filesystem  one file per response in `http.cache_dir`
+
+Every caller names the endpoint it requests, which selects the time a response
+is cached (`http.cache_ttl.<endpoint>` seconds, 0 disables the cache, -1 never
+expires) and the counters of the cache hit rate reported after every run.
+
+InfluxDB queries share one client as well, writes go through the shared
+InfluxWriter.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import requests
+import requests_cache
+from influxdb_client.client.influxdb_client import InfluxDBClient
+from requests.adapters import HTTPAdapter
+from requests_cache.backends.base import BaseCache, DictStorage
+from requests_cache.policy.expiration import DO_NOT_CACHE
+from urllib3.util.retry import Retry
+
+from cron.settings_utils import get_http_config, get_influx_config
+
+CACHE_BACKENDS = ("memory", "sqlite", "filesystem")
+
+
+class LRUStorage(DictStorage):
+    """In-memory storage that drops the least recently used entries beyond max_entries."""
+
+    def __init__(self, max_entries: int) -> None:
+        super().__init__()
+        self.data = OrderedDict()
+        self._max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        with self._lock:
+            self.data.move_to_end(key)
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value) -> None:
+        with self._lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self._max_entries:
+                self.data.popitem(last=False)
+
+
+class LRUCache(BaseCache):
+    """Cache backend keeping the responses in memory, bounded to max_entries responses."""
+
+    def __init__(self, max_entries: int, **kwargs) -> None:
+        super().__init__(cache_name="memory", **kwargs)
+        self.responses = LRUStorage(max_entries)
+        self.redirects = LRUStorage(max_entries)
+
+
+class EndpointSession:
+    """
+    Requests of one endpoint through the shared session.
+
+    Provides the get/post/request methods of a requests session, so it can be
+    handed to clients like openmeteo_requests.Client.
+
+    Args:
+        endpoint: Name of the endpoint, selects the cache TTL and the hit rate counters
+        session: Shared cached session
+        expire_after: Seconds responses are cached, 0 disables the cache, -1 never expires
+    """
+
+    def __init__(self, endpoint: str, session: requests_cache.CachedSession, expire_after: float) -> None:
+        self.endpoint = endpoint
+        self._session = session
+        self._expire_after = DO_NOT_CACHE if expire_after == 0 else expire_after
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("expire_after", self._expire_after)
+        response = self._session.request(method, url, **kwargs)
+        _record(self.endpoint, getattr(response, "from_cache", False))
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+
+_lock = threading.Lock()
+_session: Optional[requests_cache.CachedSession] = None
+_influx_client: Optional[InfluxDBClient] = None
+# Endpoint -> [hits, misses] since the last report
+_cache_counts: dict[str, list[int]] = {}
+
+
+def _record(endpoint: str, hit: bool) -> None:
+    with _lock:
+        counts = _cache_counts.setdefault(endpoint, [0, 0])
+        counts[0 if hit else 1] += 1
+
+
+def create_cache_backend(http_config: dict) -> BaseCache:
+    """Create the response cache configured in `http`."""
+    backend = http_config['cache_backend']
+    if backend == "memory":
+        return LRUCache(http_config['memory_max_entries'])
+    if backend == "sqlite":
+        return requests_cache.SQLiteCache(
+            os.path.join(http_config['cache_dir'], "http_cache.sqlite"), use_temp=False)
+    if backend == "filesystem":
+        return requests_cache.FileCache(http_config['cache_dir'])
+    raise ValueError("Unknown HTTP cache backend '{}', expected one of: {}".format(
+        backend, ", ".join(CACHE_BACKENDS)))
+
+
+def _get_session(http_config: dict) -> requests_cache.CachedSession:
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests_cache.CachedSession(backend=create_cache_backend(http_config))
+            # Same retries as retry_requests, on a pool large enough for the concurrent requests
+            retry = Retry(total=http_config['retries'], backoff_factor=0.2,
+                          status_forcelist=(500, 502, 503, 504))
+            adapter = HTTPAdapter(pool_connections=http_config['pool_maxsize'],
+                                  pool_maxsize=http_config['pool_maxsize'], max_retries=retry)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def get_http_session(endpoint: str) -> EndpointSession:
+    """Get the shared session for the requests of an endpoint, see `http.cache_ttl`."""
+    http_config = get_http_config()
+    return EndpointSession(endpoint, _get_session(http_config), http_config['cache_ttl'].get(endpoint, 0))
+
+
+def get_influx_client() -> InfluxDBClient:
+    """Get the InfluxDB client shared by all queries."""
+    global _influx_client
+    with _lock:
+        if _influx_client is None:
+            influx_config = get_influx_config()
+            _influx_client = InfluxDBClient(
+                url=influx_config["url"],
+                token=influx_config["token"],
+                org=influx_config["org"],
+                timeout=int(influx_config["query_timeout"] * 1000),
+                enable_gzip=influx_config["gzip"],
+                verify_ssl=False,  # Disable SSL verification for self-signed certificates
+                http_client_kwargs={"timeout": influx_config["query_timeout"]}
+            )
+        return _influx_client
+
+
+def report_cache_stats() -> dict[str, tuple[int, int]]:
+    """Log the cache hit rate of every endpoint requested since the last report and reset the counters."""
+    with _lock:
+        stats = {endpoint: (hits, misses) for endpoint, (hits, misses) in _cache_counts.items()}
+        _cache_counts.clear()
+    logger = logging.getLogger(__name__)
+    for endpoint, (hits, misses) in sorted(stats.items()):
+        message = "HTTP cache {}: {} of {} requests served from the cache ({:.0%})".format(
+            endpoint, hits, hits + misses, hits / (hits + misses))
+        logger.info(message)
+        print(message)
+    return stats
+
+
+def close_clients() -> None:
+    """Close the shared session and InfluxDB client, they are created again when used."""
+    global _session, _influx_client
+    with _lock:
+        session, _session = _session, None
+        influx_client, _influx_client = _influx_client, None
+    if session is not None:
+        session.close()
+    if influx_client is not None:
+        influx_client.close()
@@ -1,5 +1,7 @@
 import abc
+import threading
 from datetime import datetime
+from typing import List, Optional
 from discord import SyncWebhook
 from cron.settings_utils import get_discord_webhook_url
 
@@ -7,10 +9,16 @@ from cron.settings_utils import get_discord_webhook_url
 class CronjobBase(metaclass=abc.ABCMeta):
     '''Basis-Klasse für Cronjobs'''
 
+    # Namen der Jobs, die im selben Lauf vor diesem Job abgeschlossen sein müssen
+    dependencies: List[str] = []
+    # Maximale Laufzeit in Sekunden, None für das Standard-Timeout des Schedulers
+    timeout: Optional[float] = None
+
     def __init__(self):
         discord_webhook_url = get_discord_webhook_url()
         self._webhook = SyncWebhook.from_url(
             discord_webhook_url) if discord_webhook_url != "" else None
+        self._cancelled = threading.Event()
 
     def shouldStart(self, local_dt: datetime) -> bool:
         '''Ob der job in der aktuellen Umgebung ausgeführt werden darf.
@@ -19,6 +27,17 @@ class CronjobBase(metaclass=abc.ABCMeta):
         '''
         return True
 
+    def cancel(self):
+        '''Bricht diesen Job ab, z.B. nach Überschreiten des Timeouts.
+           Der Job wird nicht hart beendet, sondern kann über isCancelled() prüfen,
+           ob er seine Arbeit vorzeitig beenden soll.
+        '''
+        self._cancelled.set()
+
+    def isCancelled(self) -> bool:
+        '''Ob dieser Job abgebrochen wurde'''
+        return self._cancelled.is_set()
+
     @abc.abstractmethod
     def start(self, local_dt: datetime) -> bool:
         '''Führt diesen Job aus'''
@@ -0,0 +1,308 @@
+"""
+Shared writer for all InfluxDB writes of the cron jobs.
+
+Records are buffered per bucket and written in batches by a small pool of
+threads, so the number of requests in flight is bounded. Request bodies are gzip
+compressed. Batches that can not be written are appended to a spool file and
+written again the next time the writer is created, in batches of the same size.
+"""
+import glob
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Iterator, Optional, Union
+
+from influxdb_client.client.influxdb_client import InfluxDBClient
+from influxdb_client.client.write.point import Point
+from influxdb_client.client.write_api import SYNCHRONOUS
+from influxdb_client.domain.write_precision import WritePrecision
+
+from cron.settings_utils import get_influx_config
+
+Record = Union[bytes, str, Point, list[Point]]
+
+
+class InfluxWriter:
+    """
+    Batched, compressed writer with a spool for failed writes.
+
+    Args:
+        url: URL of the InfluxDB server
+        token: Token used for the requests
+        org: Organization the buckets belong to
+        batch_size: Number of lines that trigger a write of the buffered records
+        flush_interval: Seconds after which buffered records are written at the latest
+        max_in_flight: Maximum number of concurrent write requests
+        gzip: Whether request bodies are gzip compressed
+        spool_dir: Directory for the records that could not be written
+    """
+
+    def __init__(self, url: str, token: str, org: str, batch_size: int = 5000, flush_interval: float = 10,
+                 max_in_flight: int = 2, gzip: bool = True, spool_dir: Optional[str] = None) -> None:
+        self._logger = logging.getLogger(__name__)
+        self._org = org
+        self._batch_size = max(1, batch_size)
+        self._flush_interval = flush_interval
+        self._spool_dir = spool_dir
+
+        self.client = InfluxDBClient(
+            url=url, token=token, org=org, enable_gzip=gzip,
+            connection_pool_maxsize=max(1, max_in_flight))
+        self._write_api = self.client.write_api(write_options=SYNCHRONOUS)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, max_in_flight), thread_name_prefix="influx-writer")
+        # Blocks writers while the maximum number of requests is in flight
+        self._in_flight = threading.BoundedSemaphore(max(1, max_in_flight))
+        self._futures: set[Future] = set()
+        # Number of batches that were spooled, and the number when the last flush started
+        self._failed_batches = 0
+        self._failed_before_flush = 0
+
+        # Worker threads never take _lock, _lock is held while waiting for a free
+        # slot. The futures have their own lock, so finishing batches never wait for _lock
+        self._lock = threading.RLock()
+        self._futures_lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        # Overlapping runs of the daemon replay the spool concurrently
+        self._replay_lock = threading.Lock()
+        # Buffered lines per (bucket, precision)
+        self._buffers: dict[tuple[str, str], list[bytes]] = {}
+        self._buffered_lines: dict[tuple[str, str], int] = {}
+        self._buffered_since: dict[tuple[str, str], float] = {}
+
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(
+            target=self._flush_periodically, name="influx-flusher", daemon=True)
+        self._flusher.start()
+
+    def write(self, bucket: str, record: Record, precision: str = WritePrecision.NS) -> None:
+        """
+        Buffer records for writing, the batch is written once it is full.
+
+        Args:
+            bucket: Bucket to write to
+            record: Line protocol or points
+            precision: Precision of the timestamps in the records
+        """
+        data = self._to_line_protocol(record, precision)
+        if not data:
+            return
+
+        key = (bucket, precision)
+        with self._lock:
+            if key not in self._buffers:
+                self._buffers[key] = []
+                self._buffered_lines[key] = 0
+                self._buffered_since[key] = time.monotonic()
+            self._buffers[key].append(data)
+            self._buffered_lines[key] += data.count(b"\n") + 1
+            if self._buffered_lines[key] >= self._batch_size:
+                self._submit(key)
+
+    def flush(self) -> bool:
+        """
+        Write all buffered records and wait for the running requests.
+
+        Returns:
+            False if a batch written since the previous flush started could not be
+            written and was spooled, including batches written by the size trigger or
+            the periodic flush before this call
+        """
+        with self._futures_lock:
+            failed_before = self._failed_before_flush
+            self._failed_before_flush = self._failed_batches
+        with self._lock:
+            for key in list(self._buffers):
+                self._submit(key)
+        with self._futures_lock:
+            futures = list(self._futures)
+        # Waits for the running requests of all jobs, not only the records of the caller
+        wait(futures)
+        with self._futures_lock:
+            return self._failed_batches == failed_before
+
+    def close(self) -> bool:
+        """Flush the buffered records and close the connection."""
+        success = self.flush()
+        self._closed.set()
+        self._executor.shutdown(wait=True)
+        self._write_api.close()
+        self.client.close()
+        return success
+
+    def replay_spool(self) -> None:
+        """Write the records spooled by previous runs."""
+        if not self._spool_dir or not os.path.isdir(self._spool_dir):
+            return
+
+        with self._replay_lock:
+            # Replays that were interrupted, e.g. because the process was killed
+            for replay_path in glob.glob(os.path.join(self._spool_dir, "*.lp.*.replay")):
+                if self._is_orphaned(replay_path):
+                    self._replay_lines(replay_path)
+            for spool_path in glob.glob(os.path.join(self._spool_dir, "*.lp")):
+                self._replay_file(spool_path)
+
+    def _replay_file(self, spool_path: str) -> None:
+        # Move the file away first, failed writes are spooled into a new file. The
+        # name is unique per process, so a replay in another process can not overwrite it
+        replay_path = "{}.{}.replay".format(spool_path, os.getpid())
+        try:
+            os.replace(spool_path, replay_path)
+        except FileNotFoundError:
+            # Replayed by another process in the meantime
+            return
+        self._replay_lines(replay_path)
+
+    def _replay_lines(self, replay_path: str) -> None:
+        """Write a moved spool file in batches, the file is removed once every line was written or spooled again."""
+        spool_name = os.path.basename(replay_path).rsplit(".", 2)[0]
+        bucket, precision = spool_name[:-3].rsplit(".", 1)
+        self._logger.info(f"Replaying spooled lines for bucket {bucket}")
+        with open(replay_path, "rb") as f:
+            batches = self._batches((line for line in f if line.strip()), self._batch_size)
+            for batch in batches:
+                if not self._write_batch(bucket, precision, batch):
+                    # The batch was spooled, the server is not reachable, spool the rest unsent
+                    for rest in batches:
+                        self._spool(bucket, precision, rest)
+        os.remove(replay_path)
+
+    @staticmethod
+    def _batches(lines: Iterator[bytes], batch_size: int) -> Iterator[bytes]:
+        """Join the lines into batches of batch_size lines, without the trailing newline."""
+        while True:
+            batch = list(itertools.islice(lines, batch_size))
+            if not batch:
+                return
+            yield b"".join(batch).rstrip(b"\n")
+
+    @staticmethod
+    def _is_orphaned(replay_path: str) -> bool:
+        """Whether the process that moved a spool file away ended before it was replayed."""
+        pid = int(replay_path.rsplit(".", 2)[1])
+        # Replays of this process hold the replay lock, a file of its pid is left from an earlier process
+        if pid == os.getpid():
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            return False
+        return False
+
+    def _submit(self, key: tuple[str, str]) -> None:
+        """Hand the buffer of a bucket to the thread pool, the lock must be held."""
+        chunks = self._buffers.pop(key, None)
+        self._buffered_lines.pop(key, None)
+        self._buffered_since.pop(key, None)
+        if not chunks:
+            return
+
+        self._in_flight.acquire()
+        future = self._executor.submit(
+            self._write_batch, key[0], key[1], b"\n".join(chunks))
+        with self._futures_lock:
+            self._futures.add(future)
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, future: Future) -> None:
+        self._in_flight.release()
+        with self._futures_lock:
+            self._futures.discard(future)
+
+    def _write_batch(self, bucket: str, precision: str, data: bytes) -> bool:
+        try:
+            self._write_api.write(bucket=bucket, org=self._org,
+                                  record=data, write_precision=precision)
+            return True
+        except Exception as e:
+            lines = data.count(b"\n") + 1
+            self._logger.error(
+                f"Failed to write to bucket {bucket}, spooling {lines} lines: {e}")
+            print(f"Failed to write to bucket {bucket}: {e}")
+            self._spool(bucket, precision, data)
+            with self._futures_lock:
+                self._failed_batches += 1
+            return False
+
+    def _spool(self, bucket: str, precision: str, data: bytes) -> None:
+        if not self._spool_dir:
+            self._logger.error(
+                f"No spool directory configured, dropping data for bucket {bucket}")
+            return
+        os.makedirs(self._spool_dir, exist_ok=True)
+        with self._spool_lock:
+            with open(os.path.join(self._spool_dir, f"{bucket}.{precision}.lp"), "ab") as f:
+                f.write(data + b"\n")
+
+    def _flush_periodically(self) -> None:
+        while not self._closed.wait(min(1.0, self._flush_interval)):
+            now = time.monotonic()
+            with self._lock:
+                for key, since in list(self._buffered_since.items()):
+                    if now - since >= self._flush_interval:
+                        self._submit(key)
+
+    @staticmethod
+    def _to_line_protocol(record: Record, precision: str) -> bytes:
+        if isinstance(record, bytes):
+            return record
+        if isinstance(record, str):
+            return record.encode("utf-8")
+        points = [record] if isinstance(record, Point) else record
+        lines = (point.to_line_protocol(precision) for point in points)
+        return "\n".join(line for line in lines if line).encode("utf-8")
+
+
+_writer: Optional[InfluxWriter] = None
+_writer_lock = threading.Lock()
+
+
+def create_influx_writer() -> InfluxWriter:
+    """Create a writer from the `influx` settings, without replaying the spool."""
+    influx_config = get_influx_config()
+    return InfluxWriter(
+        url=influx_config['url'],
+        token=influx_config['token'],
+        org=influx_config['org'],
+        batch_size=influx_config['batch_size'],
+        flush_interval=influx_config['flush_interval'],
+        max_in_flight=influx_config['max_in_flight'],
+        gzip=influx_config['gzip'],
+        spool_dir=influx_config['spool_dir']
+    )
+
+
+def get_influx_writer() -> InfluxWriter:
+    """Get the writer shared by all jobs, records spooled by earlier runs are written on creation."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = create_influx_writer()
+            _writer.replay_spool()
+        return _writer
+
+
+def flush_influx_writer() -> bool:
+    """Write the spooled and buffered records of the shared writer, keeping it open."""
+    with _writer_lock:
+        writer = _writer
+    if writer is None:
+        return True
+    writer.replay_spool()
+    return writer.flush()
+
+
+def close_influx_writer() -> bool:
+    """Flush and close the shared writer if it was used."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            return True
+        writer, _writer = _writer, None
+    return writer.close()
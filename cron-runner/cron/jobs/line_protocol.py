@@ -0,0 +1,159 @@
+"""
+Vectorized encoder for the InfluxDB line protocol.
+
+Encodes a whole frame of field values into line protocol in one pass over the
+columns instead of building a Point per row. The output matches what
+influxdb_client's Point produces for the same values: tags and fields are sorted
+by key, NaN/inf values are left out and whole floats lose their trailing ".0".
+"""
+from typing import Any, Optional, Union
+
+import numpy as np
+import pandas as pd
+from influxdb_client.domain.write_precision import WritePrecision
+
+_PRECISION_NS = {
+    WritePrecision.S: 1_000_000_000,
+    WritePrecision.MS: 1_000_000,
+    WritePrecision.US: 1_000,
+    WritePrecision.NS: 1,
+}
+
+_ESCAPE_MEASUREMENT = str.maketrans({
+    ',': r'\,',
+    ' ': r'\ ',
+    '\n': r'\n',
+    '\t': r'\t',
+    '\r': r'\r',
+})
+
+_ESCAPE_KEY = str.maketrans({
+    ',': r'\,',
+    '=': r'\=',
+    ' ': r'\ ',
+    '\n': r'\n',
+    '\t': r'\t',
+    '\r': r'\r',
+})
+
+
+def _escape_key(value: Any) -> str:
+    return str(value).translate(_ESCAPE_KEY)
+
+
+def _escape_tag_values(values: np.ndarray) -> np.ndarray:
+    """Escape tag values like _escape_key, missing values become empty strings."""
+    missing = pd.isna(values) if values.dtype.kind in 'Of' else None
+    values = values.astype(str)
+    for code, escaped in _ESCAPE_KEY.items():
+        values = np.char.replace(values, chr(code), escaped)
+    if missing is not None and missing.any():
+        values[missing] = ''
+    return values
+
+
+def _format_floats(values: np.ndarray) -> np.ndarray:
+    """Format float64 values like str(float), without the trailing ".0" of whole numbers."""
+    text = values.astype(str)
+    if text.size == 0:
+        return text
+    whole = np.char.endswith(text, '.0')
+    if whole.any():
+        # Cut the ".0" by zeroing the last two characters of the fixed width strings
+        rows = np.flatnonzero(whole)
+        lengths = np.char.str_len(text[rows])
+        codes = text.view(np.uint32).reshape(len(text), -1)
+        codes[rows, lengths - 1] = 0
+        codes[rows, lengths - 2] = 0
+    return text
+
+
+def _format_field(key: str, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Format one field column, returns the "key=value" strings and a mask of valid values."""
+    prefix = _escape_key(key) + '='
+    if values.dtype.kind == 'f':
+        values = values.astype(np.float64, copy=False)
+        valid = np.isfinite(values)
+        text = _format_floats(values)
+    elif values.dtype.kind in 'iu':
+        valid = np.ones(len(values), dtype=bool)
+        text = np.char.add(values.astype(str), 'i')
+    elif values.dtype.kind == 'b':
+        valid = np.ones(len(values), dtype=bool)
+        text = np.where(values, 'true', 'false')
+    else:
+        valid = pd.notna(values)
+        escaped = np.char.replace(np.char.replace(
+            values.astype(str), '\\', '\\\\'), '"', '\\"')
+        text = np.char.add(np.char.add('"', escaped), '"')
+    return np.char.add(prefix, text), valid
+
+
+def _to_epoch(time: Any, precision: str) -> Union[int, np.ndarray]:
+    """Convert a timestamp or an array of timestamps into integers of the given precision."""
+    factor = _PRECISION_NS[precision]
+    if np.ndim(time) == 0:
+        if isinstance(time, (int, np.integer)):
+            return int(time)
+        # Naive datetimes are taken as UTC like the Point class does
+        return pd.Timestamp(time).value // factor
+    if np.asarray(time).dtype.kind in 'iu':
+        return np.asarray(time, dtype=np.int64)
+    return pd.DatetimeIndex(pd.to_datetime(time, utc=True)).as_unit('ns').asi8 // factor
+
+
+def encode_frame(measurement: str,
+                 fields: Union[pd.DataFrame, dict[str, np.ndarray]],
+                 tags: Optional[dict[str, Any]] = None,
+                 time: Any = None,
+                 precision: str = WritePrecision.S) -> bytes:
+    """
+    Encode a frame of field values into line protocol.
+
+    Args:
+        measurement: Name of the measurement
+        fields: Field columns, one line is written per row
+        tags: Tag values, either a single value for all rows or one value per row
+        time: Timestamp of all rows, one timestamp per row or None to let the server decide
+        precision: Precision of the written timestamps
+
+    Returns:
+        The encoded lines, rows without any valid field are left out
+    """
+    columns = {key: np.asarray(values) for key, values in fields.items()}
+    n_rows = len(next(iter(columns.values()))) if columns else 0
+    if n_rows == 0:
+        return b""
+
+    # Fields, joined by "," and sorted by key like the Point class does
+    line_fields = np.full(n_rows, '', dtype=object)
+    has_fields = np.zeros(n_rows, dtype=bool)
+    for key in sorted(columns):
+        text, valid = _format_field(key, columns[key])
+        text = text.astype(object)
+        line_fields = np.where(
+            valid, np.where(has_fields, line_fields + ',' + text, text), line_fields)
+        has_fields |= valid
+
+    # Measurement and tags, sorted by key
+    line_head = measurement.translate(_ESCAPE_MEASUREMENT)
+    for key, value in sorted((tags or {}).items()):
+        if value is None:
+            continue
+        if np.ndim(value) == 0:
+            escaped = _escape_key(value)
+            if escaped != '':
+                line_head = line_head + ',' + _escape_key(key) + '=' + escaped
+        else:
+            values = _escape_tag_values(np.asarray(value))
+            # Empty values are left out per row, like the Point class does
+            tag = np.where(values == '', '', np.char.add(',' + _escape_key(key) + '=', values)).astype(object)
+            line_head = line_head + tag
+
+    lines = line_head + ' ' + line_fields
+    if time is not None:
+        epoch = _to_epoch(time, precision)
+        lines = lines + ' ' + (np.asarray(epoch).astype(str).astype(object)
+                               if np.ndim(epoch) else str(epoch))
+
+    return '\n'.join(lines[has_fields]).encode('utf-8')
@@ -0,0 +1,159 @@
+"""
+Running error sums for the incremental benchmark.
+
+A forecast row (issue time i, forecasted date t) counts for a horizon of h hours
+at run time T while i >= T - h and t >= T - h, so it expires with the hour of
+min(i, t). The sums of every model and field are therefore kept in a ring buffer
+with one slot per hour of min(i, t). The scores of a horizon are the totals of
+the slots that are still inside its window, each run only adds the rows that
+became verifiable since the previous run.
+"""
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from cron.jobs.model_benchmarking.error_engine import forecast_errors, to_epoch_seconds
+
+# Sums kept per model, field and hour
+COUNT, SUM_ERROR, SUM_ABS_ERROR, SUM_SQUARED_ERROR = range(4)
+
+
+class ErrorAccumulator:
+    """
+    Ring buffer of error sums per model, field and hour, stored in a numpy file.
+
+    Args:
+        path: Path of the state file
+        window_hours: Longest horizon in hours, older hours are dropped
+    """
+
+    def __init__(self, path: str, window_hours: int) -> None:
+        self._path = path
+        self._slots = window_hours + 1
+        self.last_run: Optional[int] = None
+        self._models: list[str] = []
+        self._fields: list[str] = []
+        # Hour (epoch seconds) each slot holds, -1 for empty slots
+        self._slot_hours = np.full(self._slots, -1, dtype=np.int64)
+        self._sums = np.zeros((0, 0, self._slots, 4))
+
+    def load(self) -> bool:
+        """Load the state file, returns False if there is no usable state."""
+        if not os.path.exists(self._path):
+            return False
+        try:
+            with np.load(self._path) as state:
+                if state["slot_hours"].shape[0] != self._slots:
+                    print("Benchmark state was written for another window, rebuilding it")
+                    return False
+                self.last_run = int(state["last_run"])
+                self._models = state["models"].tolist()
+                self._fields = state["fields"].tolist()
+                self._slot_hours = state["slot_hours"]
+                self._sums = state["sums"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable benchmark state: {e}")
+            return False
+        return True
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+        temporary_path = self._path + ".tmp.npz"
+        np.savez(temporary_path, last_run=np.int64(self.last_run), models=np.array(self._models),
+                 fields=np.array(self._fields), slot_hours=self._slot_hours, sums=self._sums)
+        os.replace(temporary_path, self._path)
+
+    def reset(self) -> None:
+        self.last_run = None
+        self._slot_hours[:] = -1
+        self._sums[:] = 0
+
+    def add(self, forecasts: pd.DataFrame, measured: pd.DataFrame, run_time: pd.Timestamp) -> int:
+        """
+        Add the errors of newly verifiable forecasts and mark run_time as ingested.
+
+        Returns:
+            The number of added errors
+        """
+        run_seconds = self.advance(run_time)
+        if forecasts.empty:
+            return 0
+
+        errors = forecast_errors(forecasts, measured)
+        issue_seconds = to_epoch_seconds(forecasts["_time"])
+        hours = np.minimum(issue_seconds, to_epoch_seconds(forecasts["forecast_date"]))
+        hours -= hours % 3600
+        valid = np.isfinite(errors) & (hours > run_seconds - self._slots * 3600) & (hours <= run_seconds)
+        if not valid.any():
+            return 0
+
+        model_codes = self._codes(self._models, forecasts["model"].to_numpy()[valid], axis=0)
+        field_codes = self._codes(self._fields, forecasts["_field"].to_numpy()[valid], axis=1)
+        hours, errors = hours[valid], errors[valid]
+        slots = (hours // 3600) % self._slots
+        self._slot_hours[slots] = hours
+
+        cells = (model_codes * len(self._fields) + field_codes) * self._slots + slots
+        size = self._sums.shape[0] * self._sums.shape[1] * self._slots
+        sums = self._sums.reshape(size, 4)
+        sums[:, COUNT] += np.bincount(cells, minlength=size)
+        sums[:, SUM_ERROR] += np.bincount(cells, weights=errors, minlength=size)
+        sums[:, SUM_ABS_ERROR] += np.bincount(cells, weights=np.abs(errors), minlength=size)
+        sums[:, SUM_SQUARED_ERROR] += np.bincount(cells, weights=errors * errors, minlength=size)
+        return len(errors)
+
+    def advance(self, run_time: pd.Timestamp) -> int:
+        """Drop the hours that left the window at run_time and mark run_time as ingested."""
+        run_seconds = int(run_time.timestamp())
+        self._expire(run_seconds)
+        self.last_run = run_seconds
+        return run_seconds
+
+    def scores(self, run_time: pd.Timestamp, hours: int, models: list[str]) -> pd.DataFrame:
+        """
+        Get the rolling scores of a horizon from the sums of the hours inside its window.
+
+        Returns:
+            One row per model and field with count, bias, mae, mse and rmse
+        """
+        first_hour = int(run_time.timestamp()) - hours * 3600
+        in_window = self._slot_hours >= first_hour
+        totals = self._sums[:, :, in_window, :].sum(axis=2)
+
+        model_index = [i for i, model in enumerate(self._models) if model in set(models)]
+        totals = totals[model_index]
+        model_names = np.repeat(np.array(self._models, dtype=object)[model_index], len(self._fields))
+        field_names = np.tile(np.array(self._fields, dtype=object), len(model_index))
+        totals = totals.reshape(-1, 4)
+        count = totals[:, COUNT]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            df = pd.DataFrame({
+                "model": model_names,
+                "_field": field_names,
+                "count": count.astype(np.int64),
+                "bias": totals[:, SUM_ERROR] / count,
+                "mae": totals[:, SUM_ABS_ERROR] / count,
+                "mse": totals[:, SUM_SQUARED_ERROR] / count,
+            })
+        df["rmse"] = np.sqrt(df["mse"])
+        return df[count > 0].reset_index(drop=True)
+
+    def _expire(self, run_seconds: int) -> None:
+        """Clear the slots of hours that left the longest window."""
+        expired = (self._slot_hours >= 0) & (self._slot_hours <= run_seconds - self._slots * 3600)
+        self._sums[:, :, expired, :] = 0
+        self._slot_hours[expired] = -1
+
+    def _codes(self, names: list[str], values: np.ndarray, axis: int) -> np.ndarray:
+        """Map names to their index, new names extend the sums along the axis."""
+        codes, uniques = pd.factorize(values)
+        new_names = [name for name in uniques if name not in names]
+        if new_names:
+            names.extend(new_names)
+            padding = [(0, 0)] * self._sums.ndim
+            padding[axis] = (0, len(new_names))
+            self._sums = np.pad(self._sums, padding)
+        index = {name: i for i, name in enumerate(names)}
+        return np.array([index[name] for name in uniques], dtype=np.int64)[codes]
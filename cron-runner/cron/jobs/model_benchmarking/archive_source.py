@@ -0,0 +1,110 @@
+"""
+Forecasts for the benchmark read from the local archive instead of InfluxDB.
+
+OpenMeteoCsvCronjob keeps every run either as CSV files (one directory per run,
+one file per model) or in the columnar archive. Both are read here into the same
+long frame BenchmarkingService.get_forecasts returns from its Flux query, so the
+benchmark can run without a database. Only the forecasts for the default location
+are benchmarked, the files of the other locations are not read.
+"""
+import os
+from datetime import datetime, timezone
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+from cron.jobs.open_meteo.forecast_archive import archive_filter, iter_archive_runs
+from cron.jobs.open_meteo.forecast_pipeline import Location
+from cron.settings_utils import get_archive_config, get_data_dir, get_locations
+
+RUN_FORMAT = "%Y-%m-%dT%H-%M-%SZ"
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+COLUMNS = ["_time", "forecast_date", "model", "_value", "_field"]
+
+
+def iter_archived_forecasts(start_time: datetime, end_time: datetime, models: list[str], fields: list[str],
+                            forecast_start: datetime, forecast_end: datetime) -> Iterator[pd.DataFrame]:
+    """
+    Read the forecasts of the runs issued in [start_time, end_time) for the dates in
+    [forecast_start, forecast_end] from the archive configured in `archive`, run by run.
+
+    Yields:
+        Frames with the columns _time (issue time), forecast_date, model, _value and _field
+    """
+    archive_config = get_archive_config()
+    if archive_config['format'] == 'csv':
+        runs = _read_csv_runs(get_data_dir(), start_time, end_time, models, fields,
+                              forecast_start, forecast_end)
+    else:
+        runs = _read_columnar_runs(archive_config, start_time, end_time, models, fields,
+                                   forecast_start, forecast_end)
+    for wide in runs:
+        value_fields = [field for field in fields if field in wide.columns]
+        long = wide.melt(id_vars=["_time", "forecast_date", "model"], value_vars=value_fields,
+                         var_name="_field", value_name="_value")
+        # Missing values are not written to InfluxDB either
+        long = long.dropna(subset=["_value"]).reset_index(drop=True)
+        if not long.empty:
+            yield long[COLUMNS]
+
+
+def _read_csv_runs(data_dir: str, start_time: datetime, end_time: datetime, models: list[str],
+                   fields: list[str], forecast_start: datetime, forecast_end: datetime) -> Iterator[pd.DataFrame]:
+    first_date = forecast_start.strftime(DATE_FORMAT)
+    last_date = forecast_end.strftime(DATE_FORMAT)
+    for directory in sorted(os.listdir(data_dir)):
+        try:
+            issue_time = datetime.strptime(directory, RUN_FORMAT).replace(tzinfo=timezone.utc)
+        except ValueError:
+            # Directories of the old local time format
+            continue
+        if not start_time <= issue_time < end_time:
+            continue
+
+        frames = []
+        for model in models:
+            path = os.path.join(data_dir, directory, f"{model}.csv")
+            if not os.path.exists(path):
+                continue
+            # The files hold the float32 values of the responses, parsed as float32 and
+            # widened they are the values the InfluxDB job wrote
+            df = pd.read_csv(path, usecols=lambda column: column == "date" or column in fields,
+                             dtype={field: np.float32 for field in fields})
+            # ISO dates in UTC compare like the times they represent
+            dates = df["date"].to_numpy(dtype=str)
+            df = df[(dates >= first_date) & (dates <= last_date)]
+            if df.empty:
+                continue
+            df = df.rename(columns={"date": "forecast_date"})
+            df.insert(0, "_time", issue_time)
+            df.insert(2, "model", model)
+            frames.append(df)
+
+        if not frames:
+            continue
+        wide = pd.concat(frames, ignore_index=True)
+        wide["_time"] = pd.to_datetime(wide["_time"], utc=True)
+        for field in fields:
+            if field in wide.columns:
+                wide[field] = wide[field].astype(np.float64)
+        yield wide
+
+
+def _read_columnar_runs(archive_config: dict, start_time: datetime, end_time: datetime, models: list[str],
+                        fields: list[str], forecast_start: datetime, forecast_end: datetime) -> Iterator[pd.DataFrame]:
+    if not os.path.isdir(archive_config['archive_dir']):
+        return
+    expression = archive_filter(models=models, start=start_time, end=end_time,
+                                first_date=forecast_start, last_date=forecast_end,
+                                location=Location(**get_locations()[0]))
+    runs = iter_archive_runs(archive_config['archive_dir'], archive_config['format'],
+                             columns=["issue_time", "model", "date"] + fields, filter=expression)
+    for _, df in runs:
+        yield pd.DataFrame({
+            "_time": df["issue_time"],
+            "forecast_date": df["date"],
+            "model": df["model"].astype(str),
+            # Same values as the float32 forecasts widened for InfluxDB
+            **{field: df[field].to_numpy(dtype=np.float64) for field in fields if field in df.columns},
+        })
@@ -1,13 +1,85 @@
+import os
 import warnings
+from typing import Callable, Iterator
+import numpy as np
 import pandas as pd
-import requests_cache
 import openmeteo_requests
-from retry_requests import retry
 from datetime import datetime, timedelta, timezone
-from influxdb_client.client.influxdb_client import InfluxDBClient
 from influxdb_client.client.write.point import Point
-from influxdb_client.client.write_api import SYNCHRONOUS
-from cron.settings_utils import get_influx_config, get_coordinates
+from influxdb_client.domain.write_precision import WritePrecision
+from cron.jobs.clients import get_http_session, get_influx_client
+from cron.jobs.influx_writer import get_influx_writer
+from cron.jobs.model_benchmarking.accumulators import ErrorAccumulator
+from cron.jobs.model_benchmarking.archive_source import iter_archived_forecasts
+from cron.jobs.model_benchmarking.error_engine import ScoreAccumulator, lead_hours, score_forecasts
+from cron.jobs.line_protocol import encode_frame
+from cron.jobs.model_benchmarking.ground_truth import GroundTruthStore
+from cron.jobs.open_meteo.forecast_schema import (
+    ISSUE_TIME_MEASUREMENT, SCHEMA_LEAD_TIME, check_schema, lead_time_query, lead_time_to_long)
+from cron.settings_utils import get_influx_config, get_coordinates, get_state_dir, get_ground_truth_config, get_benchmark_config
+
+
+MEASURED_FIELDS = [
+    "temperature_2m", "surface_pressure", "cloud_cover",
+    "precipitation", "relative_humidity_2m", "dew_point_2m", "wind_speed_10m"
+]
+
+
+# Where the forecasts are read from, see benchmark.source
+FORECAST_SOURCES = ("influx", "archive")
+
+
+# Fields scored by their mean absolute error, all others by their RMSE
+MAE_FIELDS = ["relative_humidity_2m", "cloud_cover"]
+
+# Peak memory per forecast row while a chunk is parsed and scored, about 300-500
+# bytes with dev/bench_streaming_benchmark.py. Chunks use half of
+# benchmark.memory_limit_mb, the other half is left for the rest of the process.
+FORECAST_ROW_BYTES = 512
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def reset_peak_memory() -> bool:
+    """Reset the peak resident memory of the process to its current size, False where this is not supported"""
+    try:
+        # Linux only, "5" resets VmHWM in /proc/self/status
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_memory_mb() -> float:
+    """Peak resident memory of the process in MB since the last reset_peak_memory, NaN where it is unknown"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return float("nan")
+    # Peak since the process started, ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _rechunk(frames: Iterator[pd.DataFrame], chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Combine small frames (e.g. one per Flux table) into chunks of about chunk_rows rows"""
+    buffer, rows = [], 0
+    for frame in frames:
+        buffer.append(frame)
+        rows += len(frame)
+        if rows >= chunk_rows:
+            yield pd.concat(buffer, ignore_index=True)
+            buffer, rows = [], 0
+    if buffer:
+        yield pd.concat(buffer, ignore_index=True)
 
 
 class BenchmarkingService:
@@ -40,27 +112,68 @@ class BenchmarkingService:
         influx_config = get_influx_config()
         self.latitude, self.longitude = get_coordinates()
 
-        self.client = InfluxDBClient(
-            url=influx_config["url"],
-            token=influx_config["token"],
-            org=influx_config["org"],
-            timeout=300_000,
-            verify_ssl=False,  # Disable SSL verification for self-signed certificates
-            http_client_kwargs={"timeout": 300}
-        )
+        self.client = get_influx_client()
         self.forecastBucket = 'WeatherForecast'
+        self.schema = check_schema(influx_config["schema"])
+        self._openmeteo = None
+        self.ground_truth = GroundTruthStore(
+            os.path.join(get_state_dir(), "ground_truth.sqlite"), MEASURED_FIELDS)
+        self.refresh_hours = get_ground_truth_config()['refresh_hours']
+        benchmark_config = get_benchmark_config()
+        self.incremental = benchmark_config['incremental']
+        self.source = benchmark_config['source']
+        self.memory_limit_mb = benchmark_config['memory_limit_mb']
+        self.chunk_rows = max(1000, self.memory_limit_mb * 2**20 // 2 // FORECAST_ROW_BYTES)
+        if self.source not in FORECAST_SOURCES:
+            raise ValueError("Unknown benchmark source '{}', expected one of: {}".format(
+                self.source, ", ".join(FORECAST_SOURCES)))
         self.benchmarkingBucket = "benchmark_score"
 
-    def get_forecasts(self, start_time, end_time, models):
+    def get_forecasts(self, start_time, end_time, models, forecast_start=None, forecast_end=None):
+        """
+        Get the forecasts of the runs issued in [start_time, end_time) for the dates
+        in [forecast_start, forecast_end], by default the same period, as one frame.
+        """
+        chunks = list(self.iter_forecasts(start_time, end_time, models, forecast_start, forecast_end))
+        if not chunks:
+            return pd.DataFrame(columns=["_time", "forecast_date", "model", "_value", "_field"])
+        return pd.concat(chunks, ignore_index=True)
+
+    def iter_forecasts(self, start_time, end_time, models, forecast_start=None, forecast_end=None):
+        """
+        Stream the forecasts of get_forecasts in chunks of about `chunk_rows` rows.
+
+        The query results are parsed table by table as they arrive, so only one chunk
+        is held in memory at a time.
+        Only the forecasts for the configured latitude/longitude are benchmarked.
+
+        Yields:
+            Frames with the columns _time (issue time), forecast_date, model, _value and _field
+        """
+        forecast_start = forecast_start or start_time
+        forecast_end = forecast_end or end_time
+        if self.source == "archive":
+            runs = iter_archived_forecasts(
+                start_time, end_time, models, MEASURED_FIELDS, forecast_start, forecast_end)
+            yield from _rechunk(runs, self.chunk_rows)
+            return
+        if self.schema == SCHEMA_LEAD_TIME:
+            query = lead_time_query(
+                self.forecastBucket, start_time, end_time, models, MEASURED_FIELDS,
+                forecast_start, forecast_end, location=(self.latitude, self.longitude))
+            for chunk in _rechunk(self.stream_query(query), self.chunk_rows):
+                yield lead_time_to_long(chunk, MEASURED_FIELDS)
+            return
 
         models_flux_array = "[" + ", ".join(f'"{m}"' for m in models) + "]"
 
         query = f'''
         models = {models_flux_array}
-        startForecast = time(v: {start_time.isoformat()})
-        endForecast   = time(v: {end_time.isoformat()})
+        startForecast = time(v: {forecast_start.isoformat()})
+        endForecast   = time(v: {forecast_end.isoformat()})
             from(bucket: "{self.forecastBucket}")
                 |> range(start: {start_time.isoformat()}, stop: {end_time.isoformat()})
+                |> filter(fn: (r) => r["_measurement"] == "{ISSUE_TIME_MEASUREMENT}")
                 |> filter(fn : (r) => r["_field"] == "temperature_2m"
                     or r["_field"] == "relative_humidity_2m"
                     or r["_field"] == "precipitation"
@@ -72,36 +185,67 @@ class BenchmarkingService:
                     time(v: r.forecast_date) >= startForecast and
                     time(v: r.forecast_date) <= endForecast
                 ) |> filter(fn: (r) => contains(value: r.model, set: models) )
+                |> filter(fn: (r) => r.latitude == "{self.latitude}" and r.longitude == "{self.longitude}")
                 |> keep(columns: ["_time","forecast_date", "model", "_value", "_field"])
         '''
+        columns = ["_time", "forecast_date", "model", "_value", "_field"]
+        for chunk in _rechunk(self.stream_query(query), self.chunk_rows):
+            yield chunk[columns]
+
+    def stream_query(self, query):
+        """Run a Flux query and yield the result tables as data frames while they are parsed"""
         try:
             query_api = self.client.query_api()
-            tables = query_api.query_data_frame(query)
-            df = pd.DataFrame(tables)
+            for df in query_api.query_data_frame_stream(query):
+                # Drop the "result" and "table" columns of the annotated CSV
+                yield df.drop(columns=["result", "table"], errors="ignore")
         except Exception as e:
             print(f"Error running query: {e}")
             raise
-        return df
 
     def get_measured(self, start_time, end_time):
-        cache_session = requests_cache.CachedSession(
-            '.cache', expire_after=3600)
-        retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-        openmeteo = openmeteo_requests.Client(
-            session=retry_session)  # type: ignore
+        """
+        Get the measured values of the local days start_time to end_time, up to the current hour.
+
+        Values are served from the ground truth store, only hours that are not stored
+        yet and the latest `ground_truth.refresh_hours` hours are fetched.
+        """
+        berlin = "Europe/Berlin"
+        first_hour = pd.Timestamp(start_time.strftime("%Y-%m-%d")).tz_localize(berlin).tz_convert("UTC")
+        last_hour = (pd.Timestamp(end_time.strftime("%Y-%m-%d")) + pd.Timedelta(days=1)) \
+            .tz_localize(berlin).tz_convert("UTC") - pd.Timedelta(hours=1)
+        current_hour = pd.Timestamp.now(tz="UTC").floor("h")
+        last_hour = min(last_hour, current_hour)
+        if last_hour < first_hour:
+            return self.ground_truth.read(first_hour, last_hour)
+
+        missing = self.ground_truth.missing_hours(first_hour, last_hour)
+        # Values of the latest hours can still be corrected, fetch them again
+        refresh_start = max(first_hour, current_hour - pd.Timedelta(hours=self.refresh_hours))
+        if refresh_start <= last_hour:
+            missing = missing.union(pd.date_range(refresh_start, last_hour, freq="h"))
+        if len(missing) > 0:
+            print(f"Fetching measured data for {len(missing)} hours")
+            self.ground_truth.write(self.fetch_measured(missing.min(), missing.max()))
+
+        return self.ground_truth.read(first_hour, last_hour)
+
+    def fetch_measured(self, first_hour, last_hour):
+        """Fetch the measured values of the hours first_hour to last_hour (UTC) in long format."""
+        if self._openmeteo is None:
+            # Measured values of the latest hours are still corrected, see http.cache_ttl
+            self._openmeteo = openmeteo_requests.Client(
+                session=get_http_session("open_meteo_measured"))  # type: ignore
         url = "https://api.open-meteo.com/v1/forecast"
         params = {
             "latitude": self.latitude,
             "longitude": self.longitude,
-            "hourly": [
-                "temperature_2m", "surface_pressure", "cloud_cover",
-                "precipitation", "relative_humidity_2m", "dew_point_2m", "wind_speed_10m"
-            ],
-            "timezone": "Europe/Berlin",
-            "start_date": start_time.strftime("%Y-%m-%d"),
-            "end_date": end_time.strftime("%Y-%m-%d")
+            "hourly": MEASURED_FIELDS,
+            "timezone": "GMT",
+            "start_hour": first_hour.strftime("%Y-%m-%dT%H:%M"),
+            "end_hour": last_hour.strftime("%Y-%m-%dT%H:%M")
         }
-        responses = openmeteo.weather_api(url, params=params)
+        responses = self._openmeteo.weather_api(url, params=params)
         response = responses[0]
         hourly = response.Hourly()
 
@@ -114,15 +258,10 @@ class BenchmarkingService:
                                    utc=True),  
                 freq=pd.Timedelta(seconds=hourly.Interval()),  # type: ignore
                 inclusive="left"
-            ),
-            "temperature_2m": hourly.Variables(0).ValuesAsNumpy(), # type: ignore
-            "surface_pressure": hourly.Variables(1).ValuesAsNumpy(), # type: ignore
-            "cloud_cover": hourly.Variables(2).ValuesAsNumpy(),  # type: ignore
-            "precipitation": hourly.Variables(3).ValuesAsNumpy(), # type: ignore
-            "relative_humidity_2m": hourly.Variables(4).ValuesAsNumpy(), # type: ignore
-            "dew_point_2m": hourly.Variables(5).ValuesAsNumpy(),  # type: ignore
-            "wind_speed_10m": hourly.Variables(6).ValuesAsNumpy()  # type: ignore
+            )
         }
+        for i, field in enumerate(MEASURED_FIELDS):
+            hourly_data[field] = hourly.Variables(i).ValuesAsNumpy()  # type: ignore
         df_measured = pd.DataFrame(hourly_data)
 
         # Melt DataFrame to long format for merge
@@ -141,42 +280,19 @@ class BenchmarkingService:
                 f"Warning: Empty dataframes - forecasts: {len(df_forecasts)}, measured: {len(df_measured)}")
             return pd.DataFrame()
 
-        # Ensure datetime columns are properly formatted
-        df_forecasts["forecast_date"] = pd.to_datetime(
-            df_forecasts["forecast_date"], utc=True)
-        df_measured["date"] = pd.to_datetime(df_measured["date"], utc=True)
-
-        # Merge dataframes
-        merged_df = df_forecasts.merge(
-            df_measured,
-            left_on=["forecast_date", "_field"],
-            right_on=["date", "_field"],
-            how="inner"
-        )
-
-        if merged_df.empty:
+        error_df = score_forecasts(df_forecasts, df_measured)
+        if error_df.empty:
             print("Warning: No matching data after merge")
             return pd.DataFrame()
 
-        # Calculate error metrics
-        merged_df['abs_error'] = (
-            merged_df['_value'] - merged_df['actual_value']).abs()
-        merged_df['squared_error'] = (
-            merged_df['_value'] - merged_df['actual_value']) ** 2
-
-        # Group by model and field to calculate error statistics
-        error_df = merged_df.groupby(["model", "_field"]).agg(
-            mae=('abs_error', 'mean'),
-            mse=('squared_error', 'mean'),
-            rmse=('squared_error', lambda x: (x.mean())**0.5),
-        ).reset_index()
+        return self.select_errors(error_df, forecast_date, lead_time)
 
+    @staticmethod
+    def select_errors(error_df, forecast_date, lead_time):
+        """Pick the error metric of every field and pivot the scores to one row per model"""
         # Select appropriate error metric per field
-        error_df["selected_error"] = error_df.apply(
-            lambda row: row["mae"] if row["_field"] in ["relative_humidity_2m", "cloud_cover"]
-            else row["rmse"],
-            axis=1
-        )
+        error_df["selected_error"] = np.where(
+            error_df["_field"].isin(MAE_FIELDS), error_df["mae"], error_df["rmse"])
 
         # Pivot to have one row per model with all field errors as columns
         pivot_df = error_df.pivot_table(
@@ -191,9 +307,71 @@ class BenchmarkingService:
 
         return pivot_df
 
+    def calculate_error_curves(self, df_forecasts, df_measured):
+        """
+        Calculate the error of every model and field per lead hour.
+
+        The lead hour is the number of hours from the issue time to the forecasted date.
+        Like calculate_error, relative humidity and cloud cover are scored by their MAE
+        and all other fields by their RMSE.
+
+        Returns:
+            One row per model and lead hour with the error of every field as columns
+            and the number of scored values of every field as count_<field>
+        """
+        error_df = score_forecasts(
+            self.with_lead_hours(df_forecasts), df_measured, by=["model", "_field", "lead_hour"])
+        return self.pivot_error_curves(error_df)
+
+    @staticmethod
+    def with_lead_hours(df_forecasts):
+        """Add the lead hour to the forecasts, rows forecasted before their issue time are dropped"""
+        leads = lead_hours(df_forecasts)
+        return df_forecasts.loc[leads >= 0].assign(lead_hour=leads[leads >= 0])
+
+    @staticmethod
+    def pivot_error_curves(error_df):
+        """
+        Pick the error metric of every field and pivot the scores to one row per model and lead hour,
+        with the number of values each error was computed from as count_<field>
+        """
+        if error_df.empty:
+            return pd.DataFrame()
+
+        error_df["selected_error"] = np.where(
+            error_df["_field"].isin(MAE_FIELDS), error_df["mae"], error_df["rmse"])
+        pivot_df = error_df.pivot_table(
+            index=["model", "lead_hour"],
+            columns="_field",
+            values=["selected_error", "count"]
+        )
+        counts = pivot_df["count"].fillna(0).astype(np.int64).add_prefix("count_")
+        return pd.concat([pivot_df["selected_error"], counts], axis=1).reset_index()
+
+    def write_error_curves(self, curves: pd.DataFrame, run_time: datetime):
+        """Write the error curves as one point per model and lead hour"""
+        writer = get_influx_writer()
+        fields = [field for field in MEASURED_FIELDS if field in curves.columns]
+        counts = ["count_" + field for field in fields if "count_" + field in curves.columns]
+        record = encode_frame(
+            "forecast_error_curve",
+            {**{field: curves[field].to_numpy(dtype=np.float64) for field in fields},
+             **{count: curves[count].to_numpy(dtype=np.int64) for count in counts}},
+            tags={
+                "model": curves["model"].to_numpy(),
+                "lead_hour": curves["lead_hour"].to_numpy()
+            },
+            time=run_time,
+            precision=WritePrecision.S)
+        writer.write(self.benchmarkingBucket, record, WritePrecision.S)
+        if writer.flush():
+            print(f"Successfully wrote error curves with {len(curves)} points to InfluxDB")
+        else:
+            print("Error writing to InfluxDB, points were spooled for the next run")
+
     def write_data_to_influxdb(self, df: pd.DataFrame):
         """Write benchmark data to InfluxDB with error handling"""
-        write_api = self.client.write_api(write_options=SYNCHRONOUS)
+        writer = get_influx_writer()
         batch = []
 
         for _, row in df.iterrows():
@@ -220,13 +398,11 @@ class BenchmarkingService:
                 continue
 
         if batch:
-            try:
-                write_api.write(bucket=self.benchmarkingBucket,
-                                org="FogCast", record=batch)
+            writer.write(self.benchmarkingBucket, batch)
+            if writer.flush():
                 print(f"Successfully wrote {len(batch)} points to InfluxDB")
-            except Exception as e:
-                print(f"Error writing to InfluxDB: {e}")
-                raise
+            else:
+                print("Error writing to InfluxDB, points were spooled for the next run")
         else:
             print("No valid points to write to InfluxDB")
 
@@ -237,16 +413,22 @@ class BenchmarkingService:
         print(
             f"Collecting data from {start_time} to {end_time} for {len(models)} models")
 
+        data = self.get_benchmark_data(start_time, end_time, models)
+        if data is not None:
+            self.score_horizon(data[0], data[1], start_time, end_time, lead_time)
+
+    def get_benchmark_data(self, start_time, end_time, models):
+        """Query the forecasts and fetch the measured values of a time period, None on errors"""
         try:
             df_forecasts = self.get_forecasts(start_time, end_time, models)
             if df_forecasts.empty:
                 print(
                     f"Warning: No forecast data found for time period {start_time} to {end_time}")
-                return
+                return None
 
         except Exception as e:
             print(f"Error fetching forecast data: {e}")
-            return
+            return None
 
         print(f"Fetching measured data for the same period")
         try:
@@ -254,12 +436,33 @@ class BenchmarkingService:
             if measured_df.empty:
                 print(
                     f"Warning: No measured data found for time period {start_time} to {end_time}")
-                return
+                return None
 
         except Exception as e:
             print(f"Error fetching measured data: {e}")
-            return
+            return None
+
+        return df_forecasts, measured_df
+
+    @staticmethod
+    def select_horizon(df_forecasts, models, start_time, end_time):
+        """
+        Select the rows a query for a shorter period and fewer models would have returned.
+
+        Matches the filters of get_forecasts: issue time in [start_time, end_time),
+        forecasted date in [start_time, end_time] and the model in models.
+        """
+        issue_time = pd.to_datetime(df_forecasts["_time"], utc=True)
+        forecast_date = pd.to_datetime(df_forecasts["forecast_date"], utc=True)
+        mask = (
+            (issue_time >= start_time) & (issue_time < end_time)
+            & (forecast_date >= start_time) & (forecast_date <= end_time)
+            & df_forecasts["model"].isin(models)
+        )
+        return df_forecasts.loc[mask].reset_index(drop=True)
 
+    def score_horizon(self, df_forecasts, measured_df, start_time, end_time, lead_time):
+        """Calculate and write the error scores of one horizon"""
         print(f"Calculating error scores")
         try:
             error_df = self.calculate_error(
@@ -283,31 +486,180 @@ class BenchmarkingService:
             print(f"Error writing to InfluxDB: {e}")
             return
 
-    def run_benchmark(self):
-        """Run all benchmark calculations with proper error handling"""
+    def run_benchmark(self, is_cancelled: Callable[[], bool] = lambda: False):
+        """
+        Run all benchmark calculations with proper error handling
+
+        Args:
+            is_cancelled: Checked between the chunks of forecasts, the run stops without writing once it is True
+        """
         warnings.simplefilter("ignore")
         current_date = datetime.now(timezone.utc).replace(
             minute=0, second=0, microsecond=0)
 
         print(f"Starting benchmark run at {current_date}")
+        # The daemon keeps the process running, so measure the peak of this run only
+        peak_of_run = reset_peak_memory()
+
+        # The widest horizon contains the shorter ones, so the forecasts and
+        # measured values are fetched once and every horizon is scored from them
+        horizons = [
+            ("short-term", "24 hours", self.s_models, 1, "s"),
+            ("medium-term", "3 days", self.m_models, 3, "m"),
+            ("long-term", "7 days", self.l_models, 7, "l"),
+        ]
+        models = list(dict.fromkeys(
+            model for _, _, horizon_models, _, _ in horizons for model in horizon_models))
+        start_time = current_date - timedelta(days=max(days for _, _, _, days, _ in horizons))
 
-        # Run benchmarks for different models and timeframes
+        if self.incremental:
+            self.run_incremental_benchmark(current_date, start_time, models, horizons, is_cancelled)
+        else:
+            self.run_streaming_benchmark(current_date, start_time, models, horizons, is_cancelled)
+
+        # The peak covers the whole process, including the jobs running at the same time,
+        # so it is not compared with benchmark.memory_limit_mb
+        peak = peak_memory_mb()
+        if peak_of_run:
+            print(f"Peak memory of the process during this run, including concurrent jobs: {peak:.0f} MB")
+        else:
+            print(f"Peak memory of the process since it started, including other jobs: {peak:.0f} MB")
+        print("Benchmark run completed")
+
+    def run_streaming_benchmark(self, current_date, start_time, models, horizons,
+                                is_cancelled: Callable[[], bool] = lambda: False):
+        """
+        Score every horizon and the error curves while the forecasts are streamed.
+
+        Every chunk of forecasts is added to the running sums of each horizon it belongs
+        to and dropped again, so the memory use does not grow with the window.
+        """
+        print(f"Fetching measured data from {start_time} to {current_date}")
         try:
-            print("Running short-term benchmark (24 hours)")
-            self.generic_benchmark(self.s_models, current_date, 1, "s")
+            measured_df = self.get_measured(start_time, current_date)
+            if measured_df.empty:
+                print(
+                    f"Warning: No measured data found for time period {start_time} to {current_date}")
+                return
         except Exception as e:
-            print(f"Error in short-term benchmark: {e}")
+            print(f"Error fetching measured data: {e}")
+            return
 
+        print(
+            f"Collecting data from {start_time} to {current_date} for {len(models)} models "
+            f"in chunks of {self.chunk_rows} rows")
+        scores = {lead_time: ScoreAccumulator() for _, _, _, _, lead_time in horizons}
+        curves = ScoreAccumulator(by=["model", "_field", "lead_hour"])
+        rows = 0
         try:
-            print("Running medium-term benchmark (3 days)")
-            self.generic_benchmark(self.m_models, current_date, 3, "m")
+            for chunk in self.iter_forecasts(start_time, current_date, models):
+                if is_cancelled():
+                    print("Benchmark cancelled, nothing was written")
+                    return
+                rows += len(chunk)
+                for _, _, horizon_models, days, lead_time in horizons:
+                    horizon_start = current_date - timedelta(days=days)
+                    scores[lead_time].add(
+                        self.select_horizon(chunk, horizon_models, horizon_start, current_date), measured_df)
+                curves.add(self.with_lead_hours(chunk), measured_df)
         except Exception as e:
-            print(f"Error in medium-term benchmark: {e}")
+            print(f"Error fetching forecast data: {e}")
+            return
+        print(f"Scored {rows} forecast rows")
+        if rows == 0:
+            print(
+                f"Warning: No forecast data found for time period {start_time} to {current_date}")
+            return
+
+        # Write benchmarks for different models and timeframes
+        for name, period, _, days, lead_time in horizons:
+            try:
+                print(f"Writing {name} benchmark ({period})")
+                error_df = scores[lead_time].result()
+                if error_df.empty:
+                    print(
+                        f"Warning: No error calculations possible for time period "
+                        f"{current_date - timedelta(days=days)} to {current_date}")
+                    continue
+                self.write_data_to_influxdb(self.select_errors(error_df, current_date, lead_time))
+            except Exception as e:
+                print(f"Error in {name} benchmark: {e}")
 
+        # Error curves by lead hour, from the same data
         try:
-            print("Running long-term benchmark (7 days)")
-            self.generic_benchmark(self.l_models, current_date, 7, "l")
+            print("Calculating error curves by lead hour")
+            error_curves = self.pivot_error_curves(curves.result())
+            if error_curves.empty:
+                print("Warning: No error curves could be calculated")
+            else:
+                self.write_error_curves(error_curves, current_date)
         except Exception as e:
-            print(f"Error in long-term benchmark: {e}")
-
-        print("Benchmark run completed")
+            print(f"Error calculating error curves: {e}")
+
+    def run_incremental_benchmark(self, current_date, start_time, models, horizons,
+                                  is_cancelled: Callable[[], bool] = lambda: False):
+        """
+        Update the running error sums with the forecasts that became verifiable since
+        the last run and write the rolling scores of every horizon.
+
+        The measured values of the latest `ground_truth.refresh_hours` hours can still
+        be corrected, so only forecasts up to the hour before them are added to the sums.
+        Newer forecasts stay pending until a later run, when their measured values are final.
+
+        The full window is only queried if there is no usable state, e.g. on the first
+        run or after the job did not run for longer than the window.
+        """
+        accumulator = ErrorAccumulator(
+            os.path.join(get_state_dir(), "benchmark_accumulators.npz"),
+            window_hours=int((current_date - start_time).total_seconds() // 3600))
+        window_start = int(start_time.timestamp())
+        settled_date = current_date - timedelta(hours=self.refresh_hours)
+        settled = int(settled_date.timestamp())
+
+        if not accumulator.load() or accumulator.last_run is None \
+                or not window_start < accumulator.last_run <= settled:
+            print(f"Rebuilding the benchmark state from {start_time} to {settled_date}")
+            accumulator.reset()
+            queries = [(start_time, settled_date, start_time, settled_date)]
+        elif accumulator.last_run == settled:
+            print("Benchmark state is up to date")
+            queries = []
+        else:
+            last_run = datetime.fromtimestamp(accumulator.last_run, tz=timezone.utc)
+            print(f"Collecting forecasts that became verifiable between {last_run} and {settled_date}")
+            queries = [
+                # Dates settled since the last run, for all runs of the window. With the
+                # issue_time schema the dates are a tag, so this still reads every run of the window
+                (start_time, settled_date, last_run + timedelta(seconds=1), settled_date),
+                # Runs issued since the last run, for the dates before
+                (last_run, settled_date, start_time, last_run),
+            ]
+
+        run_time = pd.Timestamp(settled_date)
+        accumulator.advance(run_time)
+        measured_df = None
+        added = 0
+        for issue_start, issue_end, forecast_start, forecast_end in queries:
+            for chunk in self.iter_forecasts(issue_start, issue_end, models, forecast_start, forecast_end):
+                if is_cancelled():
+                    # The saved state is left as it was, the next run collects these forecasts again
+                    print("Benchmark cancelled, the benchmark state was not updated")
+                    return
+                if measured_df is None:
+                    measured_df = self.get_measured(start_time, current_date)
+                added += accumulator.add(chunk, measured_df, run_time)
+        accumulator.save()
+        print(f"Added {added} forecast errors to the benchmark state")
+
+        for name, period, horizon_models, days, lead_time in horizons:
+            try:
+                print(f"Writing {name} benchmark ({period})")
+                error_df = accumulator.scores(
+                    pd.Timestamp(current_date), days * 24, horizon_models)
+                if error_df.empty:
+                    print(f"Warning: No error scores for the {name} benchmark")
+                    continue
+                self.write_data_to_influxdb(
+                    self.select_errors(error_df, current_date, lead_time))
+            except Exception as e:
+                print(f"Error in {name} benchmark: {e}")
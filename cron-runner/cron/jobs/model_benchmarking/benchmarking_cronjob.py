@@ -3,22 +3,44 @@ import pandas as pd
 
 from cron.jobs.cronjob_base import CronjobBase
 from cron.settings import settings
+from cron.settings_utils import get_benchmark_config, get_influx_config
 from cron.jobs.model_benchmarking.benchmarking import BenchmarkingService
 
 import logging
 
 
 class BenchmarkingCronjob(CronjobBase):
+    # Score the forecasts after the forecasts of this run were written
+    dependencies = ["OpenMeteoInfluxCronjob"]
+    timeout = 1800
+
+    # Whether the warning about influx.delta_writes was logged by this process
+    _warned_delta_writes = False
 
     def __init__(self):
         super().__init__()
+        self._service = None
+
+    def shouldStart(self, local_dt: datetime) -> bool:
+        # Delta runs only hold the changed values, the InfluxDB queries would score
+        # the changed cells of a run instead of its whole forecast
+        if get_benchmark_config()['source'] == "influx" and get_influx_config()['delta_writes']:
+            if not BenchmarkingCronjob._warned_delta_writes:
+                message = ("Skipping BenchmarkingCronjob: benchmark.source 'influx' does not support "
+                           "influx.delta_writes, use benchmark.source 'archive'")
+                logging.warning(message)
+                print(message)
+                BenchmarkingCronjob._warned_delta_writes = True
+            return False
+        return True
 
     def start(self, local_dt: datetime) -> bool:
         print(
             f"Starting BenchmarkingCronjob at {local_dt.strftime('%Y-%m-%d %H:%M:%S')} UTC")
         try:
-            service = BenchmarkingService()
-            service.run_benchmark()
+            if self._service is None:
+                self._service = BenchmarkingService()
+            self._service.run_benchmark(is_cancelled=self.isCancelled)
             return True
         except BaseException as e:
             logging.exception(f"Error in BenchmarkingCronjob", exc_info=e)
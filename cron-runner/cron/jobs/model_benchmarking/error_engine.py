@@ -0,0 +1,212 @@
+"""
+Vectorized scoring of forecasts against measured values.
+
+Forecasts are matched with the measured value of their forecasted date through
+an array lookup instead of a merge, and all metrics of all groups are reduced
+in one pass with np.bincount. No Python code runs per group or per row.
+"""
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+METRICS = ["count", "bias", "mae", "mse", "rmse", "skill"]
+
+
+def to_epoch_seconds(values) -> np.ndarray:
+    """
+    Convert datetimes or ISO 8601 strings into UTC epoch seconds.
+
+    Strings are parsed once per distinct value, forecast frames repeat every
+    forecasted date for every model and field.
+    """
+    values = pd.Series(values, copy=False)
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return pd.DatetimeIndex(pd.to_datetime(values, utc=True)).as_unit("s").asi8
+    codes, uniques = pd.factorize(values)
+    seconds = pd.DatetimeIndex(pd.to_datetime(uniques, utc=True)).as_unit("s").asi8
+    return seconds[codes]
+
+
+def lead_hours(forecasts: pd.DataFrame) -> np.ndarray:
+    """Get the hours from the (hour of the) issue time to the forecasted date of every row."""
+    issue_seconds = to_epoch_seconds(forecasts["_time"])
+    target_seconds = to_epoch_seconds(forecasts["forecast_date"])
+    return (target_seconds - (issue_seconds - issue_seconds % 3600)) // 3600
+
+
+class _MeasuredLookup:
+    """Measured values as a dense (field, hour) array for vectorized lookups."""
+
+    def __init__(self, measured: pd.DataFrame, fields: pd.Index) -> None:
+        seconds = to_epoch_seconds(measured["date"])
+        field_codes = fields.get_indexer(measured["_field"])
+        keep = field_codes >= 0
+        seconds, field_codes = seconds[keep], field_codes[keep]
+        values = measured["actual_value"].to_numpy(dtype=np.float64)[keep]
+
+        self._start = seconds.min() if len(seconds) else 0
+        hours = (seconds - self._start) // 3600
+        self._table = np.full((len(fields), hours.max() + 1 if len(hours) else 0), np.nan)
+        # Only whole hours are matched, like the merge on equal timestamps
+        on_hour = (seconds - self._start) % 3600 == 0
+        self._table[field_codes[on_hour], hours[on_hour]] = values[on_hour]
+
+    def get(self, field_codes: np.ndarray, seconds: np.ndarray) -> np.ndarray:
+        offset = seconds - self._start
+        hours = offset // 3600
+        width = self._table.shape[1]
+        found = (offset % 3600 == 0) & (hours >= 0) & (hours < width)
+        cells = np.where(found, field_codes * width + hours, 0)
+        return np.where(found, self._table.ravel().take(cells) if self._table.size else np.nan, np.nan)
+
+
+def forecast_errors(forecasts: pd.DataFrame, measured: pd.DataFrame) -> np.ndarray:
+    """Get forecast - measured value of every row, NaN where no measured value is known."""
+    if forecasts.empty or measured.empty:
+        return np.full(len(forecasts), np.nan)
+    field_codes, fields = pd.factorize(forecasts["_field"])
+    lookup = _MeasuredLookup(measured, pd.Index(fields))
+    actual = lookup.get(field_codes, to_epoch_seconds(forecasts["forecast_date"]))
+    return forecasts["_value"].to_numpy(dtype=np.float64) - actual
+
+
+def _group_codes(columns: dict[str, tuple[np.ndarray, pd.Index]]) -> tuple[np.ndarray, pd.DataFrame]:
+    """
+    Number the groups of factorized key columns.
+
+    The codes of the columns are combined into one code per row, the number of
+    possible combinations is small, so the groups are found with a bincount
+    instead of sorting the rows.
+
+    Returns:
+        The group of every row (-1 for rows with a missing key) and the keys of every group
+    """
+    codes = np.zeros(len(next(iter(columns.values()))[0]), dtype=np.int64)
+    for column_codes, column_uniques in columns.values():
+        # Missing keys are factorized to -1, shift them to 0
+        codes = codes * (len(column_uniques) + 1) + (column_codes + 1)
+    present = np.flatnonzero(np.bincount(codes))
+    group_of_code = np.full(present[-1] + 1 if len(present) else 0, -1, dtype=np.int64)
+    group_of_code[present] = np.arange(len(present))
+    groups = group_of_code[codes]
+
+    # Decode the combined codes of the groups into the codes of the columns
+    keys = {}
+    remaining = present
+    for column, (_, column_uniques) in reversed(list(columns.items())):
+        remaining, column_codes = np.divmod(remaining, len(column_uniques) + 1)
+        keys[column] = column_codes - 1
+    complete = np.logical_and.reduce([column_codes >= 0 for column_codes in keys.values()])
+    groups = np.where(complete[groups], groups, -1) if len(present) else groups
+    keys = pd.DataFrame({column: columns[column][1][keys[column].clip(min=0)] for column in columns})
+    keys["_complete"] = complete
+    return groups, keys
+
+
+# Sums per group that the metrics are computed from, sums of chunks are added up
+SUMS = ["count", "sum_error", "sum_abs_error", "sum_squared_error",
+        "sum_persisted_squared_error", "sum_persistence_squared_error"]
+
+
+def _score_sums(forecasts: pd.DataFrame, measured: pd.DataFrame, by: list[str]) -> pd.DataFrame:
+    """Get the keys and SUMS of every group with at least one scored value."""
+    # Every key column is factorized once, the field codes also address the lookup
+    factorized = {column: pd.factorize(forecasts[column]) for column in dict.fromkeys(by + ["_field"])}
+    field_codes, fields = factorized["_field"]
+    lookup = _MeasuredLookup(measured, pd.Index(fields))
+    actual = lookup.get(field_codes, to_epoch_seconds(forecasts["forecast_date"]))
+    # Persistence forecast: the value measured in the hour the forecast was issued
+    issue_seconds = to_epoch_seconds(forecasts["_time"])
+    persistence = lookup.get(field_codes, issue_seconds - issue_seconds % 3600)
+
+    groups, keys = _group_codes({column: factorized[column] for column in by})
+    n_groups = len(keys)
+
+    error = forecasts["_value"].to_numpy(dtype=np.float64) - actual
+    # Rows with a missing key are not scored, like groupby leaves them out
+    scored = np.isfinite(error) & (groups >= 0)
+    persisted = scored & np.isfinite(persistence)
+    error = np.where(scored, error, 0.0)
+    squared = error * error
+    persistence_error = np.where(persisted, persistence - actual, 0.0)
+    groups = np.maximum(groups, 0)
+
+    def total(weights: np.ndarray) -> np.ndarray:
+        return np.bincount(groups, weights=weights, minlength=n_groups)
+
+    keys["count"] = total(scored.astype(np.float64))
+    keys["sum_error"] = total(error)
+    keys["sum_abs_error"] = total(np.abs(error))
+    keys["sum_squared_error"] = total(squared)
+    keys["sum_persisted_squared_error"] = total(np.where(persisted, squared, 0.0))
+    keys["sum_persistence_squared_error"] = total(persistence_error * persistence_error)
+    return keys[(keys["count"] > 0) & keys.pop("_complete")].reset_index(drop=True)
+
+
+def _metrics(sums: pd.DataFrame, by: list[str]) -> pd.DataFrame:
+    """Compute the METRICS of every group from its SUMS."""
+    scores = sums[by].copy()
+    count = sums["count"].to_numpy()
+    persistence_sq = sums["sum_persistence_squared_error"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores["count"] = count.astype(np.int64)
+        scores["bias"] = sums["sum_error"].to_numpy() / count
+        scores["mae"] = sums["sum_abs_error"].to_numpy() / count
+        scores["mse"] = sums["sum_squared_error"].to_numpy() / count
+        scores["rmse"] = np.sqrt(scores["mse"].to_numpy())
+        skill = 1 - sums["sum_persisted_squared_error"].to_numpy() / persistence_sq
+        scores["skill"] = np.where(persistence_sq > 0, skill, np.nan)
+    return scores
+
+
+def score_forecasts(forecasts: pd.DataFrame, measured: pd.DataFrame,
+                    by: Sequence[str] = ("model", "_field")) -> pd.DataFrame:
+    """
+    Score forecasts against measured values.
+
+    Args:
+        forecasts: Long frame with the columns _time (issue time), forecast_date, _field,
+            _value and the columns in `by`
+        measured: Long frame with the columns date, _field and actual_value
+        by: Columns of the forecasts to group the scores by
+
+    Returns:
+        One row per group with the keys and the metrics: count of scored values, bias
+        (mean of forecast - measured), mae, mse, rmse and the skill score against
+        persistence (1 - mse / mse of the value measured at the issue time, over the
+        values where both are known). Groups without any matched value are left out.
+    """
+    by = list(by)
+    if forecasts.empty or measured.empty:
+        return pd.DataFrame(columns=by + METRICS)
+    return _metrics(_score_sums(forecasts, measured, by), by)
+
+
+class ScoreAccumulator:
+    """
+    Scores of forecasts that arrive in chunks.
+
+    Only the sums per group are kept, so the chunks can be dropped once they were
+    added. The result is the same as score_forecasts of all chunks at once.
+    """
+
+    def __init__(self, by: Sequence[str] = ("model", "_field")) -> None:
+        self._by = list(by)
+        self._sums = pd.DataFrame(columns=self._by + SUMS)
+
+    def add(self, forecasts: pd.DataFrame, measured: pd.DataFrame) -> None:
+        if forecasts.empty or measured.empty:
+            return
+        sums = _score_sums(forecasts, measured, self._by)
+        if self._sums.empty:
+            self._sums = sums
+        else:
+            self._sums = pd.concat([self._sums, sums], ignore_index=True) \
+                .groupby(self._by, sort=False, as_index=False)[SUMS].sum()
+
+    def result(self) -> pd.DataFrame:
+        """Get the scores like score_forecasts returns them"""
+        if self._sums.empty:
+            return pd.DataFrame(columns=self._by + METRICS)
+        return _metrics(self._sums, self._by)
@@ -0,0 +1,77 @@
+"""
+Local store of the measured values the forecasts are benchmarked against.
+
+The values are kept in a sqlite table keyed by hour and field, so every
+benchmark run only has to fetch the hours that are not stored yet.
+"""
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+
+class GroundTruthStore:
+    """
+    Measured values per hour and field in a sqlite database.
+
+    Args:
+        path: Path of the sqlite database file
+        fields: Fields stored for every hour
+    """
+
+    def __init__(self, path: str, fields: list[str]) -> None:
+        self._path = path
+        self._fields = fields
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS measured ("
+                " date INTEGER NOT NULL,"
+                " field TEXT NOT NULL,"
+                " value REAL,"
+                " PRIMARY KEY (date, field)"
+                ") WITHOUT ROWID")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._path, timeout=30)
+
+    def missing_hours(self, first_hour: datetime, last_hour: datetime) -> pd.DatetimeIndex:
+        """Get the hours in [first_hour, last_hour] without a stored value for every field."""
+        hours = pd.date_range(first_hour, last_hour, freq="h")
+        with closing(self._connect()) as conn:
+            stored = conn.execute(
+                "SELECT date FROM measured WHERE date BETWEEN ? AND ?"
+                " GROUP BY date HAVING COUNT(*) >= ?",
+                (_epoch(first_hour), _epoch(last_hour), len(self._fields))).fetchall()
+        stored = np.array([row[0] for row in stored], dtype=np.int64)
+        return hours[~np.isin(hours.as_unit("s").asi8, stored)]
+
+    def write(self, df: pd.DataFrame) -> None:
+        """Store measured values in long format (date, _field, actual_value), replacing stored hours."""
+        dates = pd.DatetimeIndex(pd.to_datetime(df["date"], utc=True)).as_unit("s").asi8
+        # sqlite stores NaN as NULL
+        rows = zip(dates.tolist(), df["_field"].tolist(),
+                   df["actual_value"].astype(np.float64).tolist())
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO measured (date, field, value) VALUES (?, ?, ?)", rows)
+
+    def read(self, first_hour: datetime, last_hour: datetime) -> pd.DataFrame:
+        """Read the stored values of [first_hour, last_hour] in long format (date, _field, actual_value)."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT date, field, value FROM measured WHERE date BETWEEN ? AND ?"
+                " ORDER BY field, date",
+                (_epoch(first_hour), _epoch(last_hour))).fetchall()
+        df = pd.DataFrame(rows, columns=["date", "_field", "actual_value"])
+        df["date"] = pd.to_datetime(df["date"].astype(np.int64), unit="s", utc=True)
+        # Same precision as the values received from the API
+        df["actual_value"] = df["actual_value"].astype(np.float32)
+        return df
+
+
+def _epoch(value: datetime) -> int:
+    return int(pd.Timestamp(value).timestamp())
@@ -0,0 +1,200 @@
+"""
+Fields the models provide at a location, probed from the Open-Meteo API.
+
+Many models only forecast some of the hourly fields and answer with all-NaN
+columns for the others. The availability matrix records for every location and
+model whether the model has data there and which of the probed fields stay
+empty, so OpenMeteoCronjob only requests the fields a model provides. Fields
+added to hourly_fields.csv after the last probe are requested until the next one.
+A field that was available before is only marked missing once two consecutive
+probes found it empty, a single empty answer can be a temporary gap of the model.
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+import openmeteo_requests
+
+NO_DATA_ERROR = "No data is available for this location"
+
+
+def location_key(latitude: float, longitude: float) -> str:
+    return f"{latitude},{longitude}"
+
+
+class FieldAvailability:
+    """
+    Availability matrix (location x model x field), stored in a JSON file.
+
+    The file is read again when it changed, so a resident scheduler picks up the
+    matrix written by the refresh job.
+
+    Args:
+        path: Path of the JSON file
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._mtime: Optional[float] = None
+        self.updated: Optional[datetime] = None
+        self.fields: list[str] = []
+        # Fields of the matrix as it was read or saved, set_location updates self.fields per location
+        self._probed_fields: set[str] = set()
+        # location -> model -> {"has_data": bool, "missing": [fields], "empty": [fields]}, "empty" holds
+        # the fields that were available before and empty in the last probe, they are still requested
+        self._locations: dict[str, dict[str, dict]] = {}
+
+    def load(self) -> bool:
+        """Read the file if it changed since it was read, returns False if there is no matrix."""
+        try:
+            mtime = os.path.getmtime(self._path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return True
+        try:
+            with open(self._path) as f:
+                data = json.load(f)
+            self.updated = datetime.fromisoformat(data["updated"])
+            self.fields = data["fields"]
+            self._locations = data["locations"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable field availability file: {e}")
+            return False
+        self._probed_fields = set(self.fields)
+        self._mtime = mtime
+        return True
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+        temporary_path = self._path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump({
+                "updated": self.updated.isoformat() if self.updated else None,
+                "fields": self.fields,
+                "locations": self._locations
+            }, f, indent=1, sort_keys=True)
+        os.replace(temporary_path, self._path)
+        self._mtime = os.path.getmtime(self._path)
+        self._probed_fields = set(self.fields)
+
+    def age_days(self) -> Optional[float]:
+        """Days since the matrix was probed, None if there is none"""
+        if self.updated is None:
+            return None
+        return (datetime.now(timezone.utc) - self.updated).total_seconds() / 86400
+
+    def set_location(self, latitude: float, longitude: float, fields: list[str],
+                     available: dict[str, Optional[list[str]]]) -> None:
+        """
+        Update the matrix of a location with the results of a probe.
+
+        Args:
+            fields: Probed fields
+            available: Available fields per model, None for models without data at the location
+        """
+        self.fields = list(fields)
+        self.updated = datetime.now(timezone.utc)
+        entries = self._locations.setdefault(location_key(latitude, longitude), {})
+        # Models that could not be probed keep their previous entry
+        for model, model_fields in available.items():
+            if model_fields is None:
+                entries[model] = {"has_data": False, "missing": [], "empty": []}
+                continue
+            previous = entries.get(model)
+            # Fields the last probe found available need a second empty probe to be marked missing
+            was_available = set() if previous is None or not previous["has_data"] else \
+                self._probed_fields - set(previous["missing"]) - set(previous.get("empty", []))
+            empty = [field for field in fields if field not in model_fields]
+            entries[model] = {
+                "has_data": True,
+                "missing": [field for field in empty if field not in was_available],
+                "empty": [field for field in empty if field in was_available]
+            }
+
+    def fields_for(self, model: str, latitude: float, longitude: float,
+                   hourly_fields: list[str], required: list[str]) -> Optional[list[str]]:
+        """
+        Get the fields to request from a model at a location.
+
+        Fields that were not probed and the required fields are always requested.
+
+        Returns:
+            The fields in the order of hourly_fields, None if the model has no data at the location
+        """
+        entry = self._locations.get(location_key(latitude, longitude), {}).get(model)
+        if entry is None:
+            return list(hourly_fields)
+        if not entry["has_data"]:
+            return None
+        missing = set(entry["missing"]) - set(required)
+        return [field for field in hourly_fields if field not in missing]
+
+    def missing_fields(self, latitude: float, longitude: float) -> dict[str, Optional[list[str]]]:
+        """Fields without data per model, None for models without data at the location"""
+        return {model: entry["missing"] if entry["has_data"] else None
+                for model, entry in self._locations.get(location_key(latitude, longitude), {}).items()}
+
+
+def probe_model(openmeteo: openmeteo_requests.Client, model: str, coordinates: list[tuple[float, float]],
+                fields: list[str], timeout: float) -> list[Optional[list[str]]]:
+    """
+    Request all fields from a model at several locations and check which of them hold any value.
+
+    Returns:
+        The available fields per location, None for locations without data
+    """
+    params = {
+        "latitude": ",".join(str(latitude) for latitude, _ in coordinates),
+        "longitude": ",".join(str(longitude) for _, longitude in coordinates),
+        "hourly": fields,
+        "timezone": "GMT",
+        "models": [model],
+        "forecast_days": 16
+    }
+    try:
+        responses = openmeteo.weather_api(
+            "https://api.open-meteo.com/v1/forecast", params=params, timeout=timeout)
+    except Exception as e:
+        if NO_DATA_ERROR not in str(e):
+            raise
+        if len(coordinates) == 1:
+            return [None]
+        # One location without data fails the request for all of them
+        return [probe_model(openmeteo, model, [location], fields, timeout)[0] for location in coordinates]
+
+    available: list[Optional[list[str]]] = [None] * len(coordinates)
+    for response in responses:
+        hourly = response.Hourly()
+        available[response.LocationId()] = [
+            field for i, field in enumerate(fields)
+            if not np.isnan(hourly.Variables(i).ValuesAsNumpy()).all()]  # type: ignore
+    return available
+
+
+def probe_availability(openmeteo: openmeteo_requests.Client, models: list[str], fields: list[str],
+                       coordinates: list[tuple[float, float]], max_workers: int, timeout: float,
+                       location_batch_size: int = 1) -> dict[tuple[float, float], dict[str, Optional[list[str]]]]:
+    """
+    Probe all models concurrently, `location_batch_size` locations per request.
+
+    Returns:
+        The available fields per location and model, None for models without data at a location.
+        Models that could not be probed are left out.
+    """
+    available: dict[tuple[float, float], dict[str, Optional[list[str]]]] = {location: {} for location in coordinates}
+    batches = [coordinates[i:i + max(1, location_batch_size)]
+               for i in range(0, len(coordinates), max(1, location_batch_size))]
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="field-probe") as executor:
+        futures = {(model, i): executor.submit(probe_model, openmeteo, model, batch, fields, timeout)
+                   for model in models for i, batch in enumerate(batches)}
+        for (model, i), future in futures.items():
+            try:
+                for location, model_fields in zip(batches[i], future.result()):
+                    available[location][model] = model_fields
+            except Exception as e:
+                print(f"Unable to probe model {model}: {e}")
+    return available
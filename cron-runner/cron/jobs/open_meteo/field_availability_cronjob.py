@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from cron.jobs.open_meteo.field_availability import FieldAvailability, probe_availability
+from cron.jobs.open_meteo.open_meteo_cronjob import OpenMeteoCronjob
+from cron.settings_utils import get_field_availability_config
+
+
+class FieldAvailabilityCronjob(OpenMeteoCronjob):
+    """Probes which fields the models provide, once the matrix is older than `field_availability.refresh_days`."""
+    timeout = 1800
+
+    def __init__(self):
+        super().__init__()
+        availability_config = get_field_availability_config()
+        self._refresh_days = availability_config['refresh_days']
+        self._matrix = FieldAvailability(availability_config['path'])
+
+    def shouldStart(self, local_dt: datetime) -> bool:
+        if not self._matrix.load():
+            return True
+        age = self._matrix.age_days()
+        return age is None or age >= self._refresh_days
+
+    def start(self, local_dt: datetime) -> bool:
+        self.refresh()
+        return True
+
+    def refresh(self) -> FieldAvailability:
+        """Probe all models at the configured locations and save the matrix."""
+        self._matrix.load()
+        coordinates = [(location.latitude, location.longitude) for location in self._locations]
+        print("Probing {} fields of {} models at {} locations".format(
+            len(self._hourly_fields), len(self._models), len(coordinates)))
+        available = probe_availability(
+            self._get_client(), self._models, self._hourly_fields, coordinates,
+            self._max_workers, self._request_timeout, self._location_batch_size)
+        if not any(available.values()):
+            raise Exception("No model could be probed")
+
+        for location in self._locations:
+            location_available = available[(location.latitude, location.longitude)]
+            self._matrix.set_location(location.latitude, location.longitude, self._hourly_fields, location_available)
+            requested = len(location_available) * len(self._hourly_fields)
+            provided = sum(len(fields) for fields in location_available.values() if fields is not None)
+            print("Models provide {} of {} model fields, {} models have no data for location {}".format(
+                provided, requested, sum(fields is None for fields in location_available.values()), location.name))
+        self._matrix.save()
+        return self._matrix
+
+    def cleanUpAfterError(self):
+        pass
@@ -0,0 +1,247 @@
+"""
+Columnar archive of the fetched forecasts.
+
+Every run is stored as a single Parquet or Arrow IPC file holding all models
+and locations, in one directory per issue date:
+
+    <archive_dir>/issue_date=2025-01-31/2025-01-31T12-00-00Z.parquet
+
+Values are stored as float32, the issue time and the forecasted date as int64
+second timestamps and the files are compressed. Reads go through a pyarrow
+dataset, so only the selected columns are read and filters on the issue date,
+the model, the location or the forecasted date skip whole directories, files and
+row groups. Runs archived before the location column was added are read as
+forecasts for the default location.
+
+pyarrow is an optional dependency (pip install .[archive]).
+"""
+import os
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on the installation
+    pa = ds = pq = None
+
+from cron.jobs.open_meteo.forecast_pipeline import Location, ModelForecast
+
+ARCHIVE_FORMATS = {
+    # Archive format: (file extension, pyarrow dataset format)
+    "parquet": (".parquet", "parquet"),
+    "arrow": (".arrow", "ipc"),
+}
+
+RUN_FORMAT = "%Y-%m-%dT%H-%M-%SZ"
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError(
+            "The parquet and arrow archive formats need pyarrow, install it with: pip install .[archive]")
+
+
+def _check_format(archive_format: str) -> None:
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError("Unknown archive format '{}', expected one of: {}".format(
+            archive_format, ", ".join(ARCHIVE_FORMATS)))
+
+
+def _utc(value: datetime) -> pd.Timestamp:
+    """Naive datetimes are taken as UTC."""
+    timestamp = pd.Timestamp(value)
+    return timestamp.tz_convert("UTC") if timestamp.tzinfo else timestamp.tz_localize("UTC")
+
+
+def _timestamps(values) -> "pa.Array":
+    seconds = np.asarray(values, dtype="datetime64[s]")
+    return pa.array(seconds.astype(np.int64), type=pa.int64()).cast(pa.timestamp("s", tz="UTC"))
+
+
+def _dictionary(names: list[str], lengths: list[int]) -> "pa.DictionaryArray":
+    """Repeat every name for the rows of its forecast, each distinct name is stored once."""
+    values = list(dict.fromkeys(names))
+    indices = np.repeat(np.array([values.index(name) for name in names], dtype=np.int32), lengths)
+    return pa.DictionaryArray.from_arrays(pa.array(indices, type=pa.int32()), pa.array(values, type=pa.string()))
+
+
+def forecasts_to_table(issue_time: datetime, forecasts: list[ModelForecast], hourly_fields: list[str]) -> "pa.Table":
+    """
+    Combine the forecasts of all models of a run into one table.
+
+    Args:
+        issue_time: Time of the run
+        forecasts: Typed frames of the models
+        hourly_fields: Field columns of the table, fields missing for a model are null
+
+    Returns:
+        Table with the columns issue_time, location, model, date and one float32 column per field
+    """
+    _require_pyarrow()
+    lengths = [len(forecast.data) for forecast in forecasts]
+    n_rows = sum(lengths)
+
+    issue_seconds = int(_utc(issue_time).timestamp())
+    models = _dictionary([forecast.model for forecast in forecasts], lengths)
+    locations = _dictionary([forecast.location.name for forecast in forecasts], lengths)
+    dates = np.concatenate([forecast.data["date"].to_numpy(dtype="datetime64[s]") for forecast in forecasts]) \
+        if forecasts else np.empty(0, dtype="datetime64[s]")
+
+    columns = {
+        "issue_time": pa.array(np.full(n_rows, issue_seconds, dtype=np.int64)).cast(pa.timestamp("s", tz="UTC")),
+        "location": locations,
+        "model": models,
+        "date": _timestamps(dates),
+    }
+    for field in hourly_fields:
+        values = [forecast.data[field].to_numpy(dtype=np.float32) if field in forecast.data
+                  else np.full(length, np.nan, dtype=np.float32)
+                  for forecast, length in zip(forecasts, lengths)]
+        values = np.concatenate(values) if values else np.empty(0, dtype=np.float32)
+        # NaN marks values the model does not forecast, store them as nulls
+        columns[field] = pa.array(values, mask=np.isnan(values), type=pa.float32())
+    return pa.table(columns)
+
+
+def write_archive_run(archive_dir: str, issue_time: datetime, forecasts: list[ModelForecast],
+                      hourly_fields: list[str], archive_format: str = "parquet",
+                      compression: str = "zstd") -> str:
+    """
+    Write the forecasts of all models of a run into one archive file.
+
+    The file is written under a hidden temporary name first and renamed when it is
+    complete, so readers never see partially written runs.
+
+    Returns:
+        Path of the written file
+    """
+    _require_pyarrow()
+    _check_format(archive_format)
+    extension, _ = ARCHIVE_FORMATS[archive_format]
+    issue_time = issue_time.astimezone(timezone.utc)
+
+    directory = os.path.join(archive_dir, "issue_date={}".format(issue_time.strftime("%Y-%m-%d")))
+    os.makedirs(directory, exist_ok=True)
+    file_name = issue_time.strftime(RUN_FORMAT) + extension
+    path = os.path.join(directory, file_name)
+    temporary_path = os.path.join(directory, "." + file_name + ".tmp")
+
+    table = forecasts_to_table(issue_time, forecasts, hourly_fields)
+    try:
+        if archive_format == "parquet":
+            # Dictionaries only pay off for the names, the float columns
+            # compress better with their bytes split into separate streams
+            pq.write_table(table, temporary_path, compression=compression,
+                           use_dictionary=["location", "model"],
+                           column_encoding={field: "BYTE_STREAM_SPLIT" for field in hourly_fields})
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=compression)
+            with pa.OSFile(temporary_path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                    writer.write_table(table)
+        os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+    return path
+
+
+def open_archive(archive_dir: str, archive_format: str = "parquet") -> "ds.Dataset":
+    """Open the archive as a dataset partitioned by issue date."""
+    _require_pyarrow()
+    _check_format(archive_format)
+    _, dataset_format = ARCHIVE_FORMATS[archive_format]
+    partitioning = ds.partitioning(pa.schema([("issue_date", pa.date32())]), flavor="hive")
+    dataset = ds.dataset(archive_dir, format=dataset_format, partitioning=partitioning)
+    if not dataset.files:
+        return dataset
+    # The dataset takes the schema of an arbitrary file, use the latest run instead,
+    # so columns added later are read from every run (null for older runs)
+    latest = max(dataset.files, key=os.path.basename)
+    schema = ds.dataset(latest, format=dataset_format).schema.append(pa.field("issue_date", pa.date32()))
+    return ds.dataset(archive_dir, format=dataset_format, partitioning=partitioning, schema=schema)
+
+
+def archive_filter(models: Optional[list[str]] = None,
+                   start: Optional[datetime] = None,
+                   end: Optional[datetime] = None,
+                   first_date: Optional[datetime] = None,
+                   last_date: Optional[datetime] = None,
+                   location: Optional[Location] = None) -> Optional["ds.Expression"]:
+    """
+    Build a filter for runs issued in [start, end), the given models and location,
+    optionally only for the forecasted dates in [first_date, last_date].
+
+    The issue date partition is filtered as well, so runs outside the range are not opened.
+    """
+    _require_pyarrow()
+    conditions = []
+    if models is not None:
+        conditions.append(ds.field("model").isin(models))
+    if location is not None:
+        condition = ds.field("location") == location.name
+        if location.primary:
+            condition = condition | ds.field("location").is_null()
+        conditions.append(condition)
+    if start is not None:
+        start = _utc(start)
+        conditions.append(ds.field("issue_date") >= start.date())
+        conditions.append(ds.field("issue_time") >= pa.scalar(start.to_pydatetime(), pa.timestamp("s", tz="UTC")))
+    if end is not None:
+        end = _utc(end)
+        conditions.append(ds.field("issue_date") <= end.date())
+        conditions.append(ds.field("issue_time") < pa.scalar(end.to_pydatetime(), pa.timestamp("s", tz="UTC")))
+    if first_date is not None:
+        conditions.append(ds.field("date") >= pa.scalar(_utc(first_date).to_pydatetime(), pa.timestamp("s", tz="UTC")))
+    if last_date is not None:
+        conditions.append(ds.field("date") <= pa.scalar(_utc(last_date).to_pydatetime(), pa.timestamp("s", tz="UTC")))
+    if not conditions:
+        return None
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+
+def read_archive(archive_dir: str, archive_format: str = "parquet",
+                 columns: Optional[list[str]] = None,
+                 filter: Optional["ds.Expression"] = None) -> pd.DataFrame:
+    """
+    Read forecasts from the archive.
+
+    Args:
+        archive_dir: Root directory of the archive
+        archive_format: Format the archive was written in
+        columns: Columns to read, None reads all columns
+        filter: Filter pushed down to the files, see archive_filter
+
+    Returns:
+        Frame with UTC datetimes for issue_time and date and float32 values
+    """
+    table = open_archive(archive_dir, archive_format).to_table(columns=columns, filter=filter)
+    return table.to_pandas()
+
+
+def iter_archive_runs(archive_dir: str, archive_format: str = "parquet",
+                      columns: Optional[list[str]] = None,
+                      filter: Optional["ds.Expression"] = None) -> Iterator[tuple[datetime, pd.DataFrame]]:
+    """
+    Read the archive run by run, in the order the runs were issued.
+
+    Yields:
+        The issue time of a run and its forecasts
+    """
+    dataset = open_archive(archive_dir, archive_format)
+    fragments = sorted(dataset.get_fragments(filter=filter), key=lambda fragment: os.path.basename(fragment.path))
+    for fragment in fragments:
+        issue_time = datetime.strptime(
+            os.path.splitext(os.path.basename(fragment.path))[0], RUN_FORMAT).replace(tzinfo=timezone.utc)
+        table = fragment.to_table(columns=columns, filter=filter, schema=dataset.schema)
+        if table.num_rows > 0:
+            yield issue_time, table.to_pandas()
+
@@ -0,0 +1,78 @@
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Optional
+
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class Location:
+    name: str
+    latitude: float
+    longitude: float
+    # The location of `latitude`/`longitude`, stored like before there were several locations
+    primary: bool = False
+
+
+@dataclass
+class ModelForecast:
+    model: str
+    # Typed frame as returned by extract_model_frame
+    data: pd.DataFrame
+    location: Location
+
+
+class ForecastPipeline:
+    """
+    Fetches the forecasts of a scheduler run once and shares them between all sinks.
+
+    Sinks are the jobs that store the forecasts somewhere (CSV files, InfluxDB, ...).
+    The first sink of a run triggers the fetch, every following sink of the same run
+    receives the already decoded data frames. The frames are shared, so sinks must
+    not modify them in place. Once every registered sink has consumed the forecasts
+    of a run, they are released again.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._sinks: set[str] = set()
+        self._run: Optional[datetime] = None
+        self._forecasts: Optional[list[ModelForecast]] = None
+        self._consumers: set[str] = set()
+
+    def register_sink(self, sink_class: type) -> type:
+        """Class decorator registering a job as a consumer of the shared forecasts."""
+        self._sinks.add(sink_class.__name__)
+        return sink_class
+
+    def get_forecasts(self, run: datetime, sink: str, fetch: Callable[[], list[ModelForecast]]) -> list[ModelForecast]:
+        """
+        Get the forecasts of a run, fetching them if no other sink did so yet.
+
+        Args:
+            run: Time of the scheduler run, identifies the forecasts
+            sink: Name of the sink consuming the forecasts
+            fetch: Function fetching and decoding the forecasts
+
+        Returns:
+            The forecasts of all models for this run
+        """
+        # Holding the lock while fetching lets concurrently started sinks
+        # wait for the running fetch instead of starting their own
+        with self._lock:
+            if self._run != run or self._forecasts is None:
+                self._forecasts = fetch()
+                self._run = run
+                self._consumers = set()
+            forecasts = self._forecasts
+
+            self._consumers.add(sink)
+            if self._sinks.issubset(self._consumers):
+                # Every sink got the data, no need to keep it in memory
+                self._forecasts = None
+        return forecasts
+
+
+# Usage
+forecast_pipeline = ForecastPipeline()
@@ -0,0 +1,130 @@
+"""
+Schemas of the forecasts stored in InfluxDB, selected by `influx.schema`.
+
+issue_time (default): measurement "forecast", the point time is the time of the
+    run and the forecasted date is the string tag "forecast_date". Queries for a
+    range of forecasted dates have to parse that tag for every row.
+
+lead_time: measurement "forecast_lead", the point time is the forecasted date.
+    The run is stored as the integer field "issue_time" (epoch seconds) and the
+    hours between the hour of the run and the forecasted date as the tag
+    "lead_hour", which only has a few hundred values. Queries for forecasted dates use range() directly.
+"""
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from influxdb_client.domain.write_precision import WritePrecision
+
+from cron.jobs.line_protocol import encode_frame
+
+SCHEMA_ISSUE_TIME = "issue_time"
+SCHEMA_LEAD_TIME = "lead_time"
+SCHEMAS = (SCHEMA_ISSUE_TIME, SCHEMA_LEAD_TIME)
+
+ISSUE_TIME_MEASUREMENT = "forecast"
+LEAD_TIME_MEASUREMENT = "forecast_lead"
+
+
+def check_schema(schema: str) -> str:
+    if schema not in SCHEMAS:
+        raise ValueError("Unknown forecast schema '{}', expected one of: {}".format(
+            schema, ", ".join(SCHEMAS)))
+    return schema
+
+
+def encode_lead_time(fields: dict[str, np.ndarray], dates: pd.Series, issue_time: datetime,
+                     tags: Optional[dict] = None) -> bytes:
+    """
+    Encode the forecast of one run in the lead time schema.
+
+    Args:
+        fields: Field columns, NaN values are left out
+        dates: Forecasted dates of the rows (UTC)
+        issue_time: Time of the run, stored exactly, the lead hours count from its hour
+        tags: Additional tags (model, location)
+
+    Returns:
+        The encoded lines, rows without any forecasted value are left out
+    """
+    columns = {key: np.asarray(values) for key, values in fields.items()}
+    n_rows = len(dates)
+    # The issue time is valid for every row, drop rows without a forecasted value first
+    has_values = np.zeros(n_rows, dtype=bool)
+    for values in columns.values():
+        has_values |= ~pd.isna(values)
+    if not has_values.any():
+        return b""
+
+    target = pd.DatetimeIndex(pd.to_datetime(dates, utc=True)).as_unit("s").asi8[has_values]
+    issue_seconds = int(pd.Timestamp(issue_time).timestamp())
+    columns = {key: values[has_values] for key, values in columns.items()}
+    columns["issue_time"] = np.full(len(target), issue_seconds, dtype=np.int64)
+
+    lead_tags = dict(tags or {})
+    # Runs start a few seconds after the hour, count from the hour like error_engine.lead_hours
+    lead_tags["lead_hour"] = (target - (issue_seconds - issue_seconds % 3600)) // 3600
+    return encode_frame(LEAD_TIME_MEASUREMENT, columns, tags=lead_tags,
+                        time=target, precision=WritePrecision.S)
+
+
+def _flux_set(values: list[str]) -> str:
+    return "[" + ", ".join(f'"{value}"' for value in values) + "]"
+
+
+def lead_time_query(bucket: str, start_time: datetime, end_time: datetime,
+                    models: list[str], fields: list[str],
+                    forecast_start: Optional[datetime] = None,
+                    forecast_end: Optional[datetime] = None,
+                    location: Optional[tuple[float, float]] = None) -> str:
+    """
+    Flux query for the forecasts of runs issued in [start_time, end_time) for
+    dates in [forecast_start, forecast_end], by default the same period. These
+    are the same rows the issue time query returns. A (latitude, longitude)
+    location limits the query to the forecasts for that location.
+    """
+    start = int(pd.Timestamp(start_time).timestamp())
+    end = int(pd.Timestamp(end_time).timestamp())
+    first_date = int(pd.Timestamp(forecast_start or start_time).timestamp())
+    last_date = int(pd.Timestamp(forecast_end or end_time).timestamp())
+    location_filter = ""
+    if location is not None:
+        location_filter = '|> filter(fn: (r) => r.latitude == "{}" and r.longitude == "{}")'.format(*location)
+    return f'''
+        models = {_flux_set(models)}
+        fields = {_flux_set(fields + ["issue_time"])}
+        from(bucket: "{bucket}")
+            |> range(start: {first_date}, stop: {last_date + 1})
+            |> filter(fn: (r) => r["_measurement"] == "{LEAD_TIME_MEASUREMENT}")
+            |> filter(fn: (r) => contains(value: r._field, set: fields))
+            |> filter(fn: (r) => contains(value: r.model, set: models))
+            {location_filter}
+            |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+            |> filter(fn: (r) => r.issue_time >= {start} and r.issue_time < {end})
+            |> drop(columns: ["_start", "_stop", "_measurement", "lead_hour", "latitude", "longitude"])
+    '''
+
+
+def lead_time_to_long(df: pd.DataFrame, fields: list[str]) -> pd.DataFrame:
+    """
+    Convert pivoted lead time rows into the long format of the issue time query.
+
+    Returns:
+        Frame with the columns _time (issue time), forecast_date, model, _value and _field
+    """
+    if df.empty:
+        return pd.DataFrame(columns=["_time", "forecast_date", "model", "_value", "_field"])
+    wide = pd.DataFrame({
+        "_time": pd.to_datetime(df["issue_time"].astype(np.int64), unit="s", utc=True),
+        "forecast_date": pd.to_datetime(df["_time"], utc=True),
+        "model": df["model"],
+    })
+    value_fields = [field for field in fields if field in df.columns]
+    for field in value_fields:
+        wide[field] = df[field].astype(np.float64)
+    long = wide.melt(id_vars=["_time", "forecast_date", "model"], value_vars=value_fields,
+                     var_name="_field", value_name="_value")
+    # Fields a run did not forecast are not stored in the issue time schema either
+    long = long.dropna(subset=["_value"]).reset_index(drop=True)
+    return long[["_time", "forecast_date", "model", "_value", "_field"]]
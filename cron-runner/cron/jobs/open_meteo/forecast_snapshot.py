@@ -0,0 +1,100 @@
+"""
+Local snapshots of the forecast values last written to InfluxDB.
+
+Used by the delta mode of OpenMeteoInfluxCronjob: a new run of a model is
+compared against the snapshot of that model and only the cells whose value
+changed are written. Most models publish a new run only every 3-12 hours, so
+most hourly fetches repeat the values of the previous one.
+"""
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class Snapshot:
+    # Forecasted dates as UTC epoch seconds
+    dates: np.ndarray
+    fields: list[str]
+    # float32 values, one row per date and one column per field
+    values: np.ndarray
+
+
+class SnapshotStore:
+    """
+    Snapshots of the last written forecast per model, stored as compressed numpy files.
+
+    Args:
+        directory: Directory of the snapshot files
+    """
+
+    def __init__(self, directory: str) -> None:
+        self._directory = directory
+
+    def load(self, model: str) -> Optional[Snapshot]:
+        """Load the snapshot of a model, None if there is none or it can not be read."""
+        path = self._path(model)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as snapshot:
+                return Snapshot(snapshot["dates"], snapshot["fields"].tolist(), snapshot["values"])
+        except (OSError, ValueError, KeyError) as e:
+            print("Ignoring unreadable snapshot of model {}: {}".format(model, e))
+            return None
+
+    def save(self, model: str, frame: pd.DataFrame) -> None:
+        """Store a typed frame as the snapshot of a model."""
+        snapshot = to_snapshot(frame)
+        os.makedirs(self._directory, exist_ok=True)
+        path = self._path(model)
+        temporary_path = path + ".tmp.npz"
+        np.savez_compressed(temporary_path, dates=snapshot.dates,
+                            fields=np.array(snapshot.fields), values=snapshot.values)
+        os.replace(temporary_path, path)
+
+    def _path(self, model: str) -> str:
+        return os.path.join(self._directory, "{}.npz".format(model))
+
+
+def to_snapshot(frame: pd.DataFrame) -> Snapshot:
+    """Convert a typed frame as returned by extract_model_frame into a snapshot."""
+    fields = [column for column in frame.columns if column != "date"]
+    dates = frame["date"].to_numpy(dtype="datetime64[s]").astype(np.int64)
+    values = np.empty((len(frame), len(fields)), dtype=np.float32)
+    for i, field in enumerate(fields):
+        values[:, i] = frame[field].to_numpy(dtype=np.float32)
+    return Snapshot(dates, fields, values)
+
+
+def changed_fields(frame: pd.DataFrame, snapshot: Optional[Snapshot]) -> tuple[dict[str, np.ndarray], int]:
+    """
+    Compare a typed frame with the snapshot of the previous run.
+
+    Cells are unchanged if the snapshot holds the same value for the same date and
+    field. Dates and fields missing in the snapshot count as changed.
+
+    Returns:
+        The field columns with every unchanged cell set to NaN and the number of changed cells
+    """
+    fields = [column for column in frame.columns if column != "date"]
+    new = to_snapshot(frame)
+    changed = ~np.isnan(new.values)
+    if snapshot is not None:
+        # Both runs are hourly grids, match the rows by their date
+        _, new_rows, old_rows = np.intersect1d(new.dates, snapshot.dates, assume_unique=True, return_indices=True)
+        old_columns = {field: i for i, field in enumerate(snapshot.fields)}
+        new_columns = [i for i, field in enumerate(fields) if field in old_columns]
+        old_columns = [old_columns[fields[i]] for i in new_columns]
+        if len(new_rows) > 0 and len(new_columns) > 0:
+            # NaN never compares equal, NaN cells are not written anyway
+            same = new.values[np.ix_(new_rows, new_columns)] == snapshot.values[np.ix_(old_rows, old_columns)]
+            block = changed[np.ix_(new_rows, new_columns)]
+            changed[np.ix_(new_rows, new_columns)] = block & ~same
+
+    columns = {field: np.where(changed[:, i], new.values[:, i], np.float32(np.nan))
+               for i, field in enumerate(fields)}
+    return columns, int(changed.sum())
@@ -1,24 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor, wait
 from dataclasses import dataclass
 from datetime import datetime
+from typing import Optional
+import time
 import openmeteo_requests
 
 from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
 
-import requests_cache
 import pandas as pd
-from retry_requests import retry
 
+from cron.jobs.clients import get_http_session
 from cron.jobs.cronjob_base import CronjobBase
-from cron.settings_utils import get_setting, get_coordinates
+from cron.jobs.open_meteo.field_availability import FieldAvailability
+from cron.jobs.open_meteo.forecast_pipeline import Location, ModelForecast, forecast_pipeline
+from cron.jobs.toDataFrame import KEY_FIELDS, extract_model_frame
+from cron.settings_utils import get_setting, get_locations, get_open_meteo_config, get_field_availability_config
 
 
 @dataclass
 class ModelResponse:
     model: str
     response: WeatherApiResponse
+    # Fields requested from the model, in the order of the response variables
+    hourly_fields: list[str]
+    location: Location
 
 
 class OpenMeteoCronjob(CronjobBase):
+    timeout = 3000
 
     def __init__(self):
         super().__init__()
@@ -35,46 +44,187 @@ class OpenMeteoCronjob(CronjobBase):
         self._hourly_fields = [row['field']
                                for _, row in hourly_fields_df.iterrows()]
 
+        open_meteo_config = get_open_meteo_config()
+        self._batch_size = max(1, open_meteo_config['batch_size'])
+        self._max_workers = max(1, open_meteo_config['max_workers'])
+        self._request_timeout = open_meteo_config['request_timeout']
+        self._deadline = open_meteo_config['deadline']
+        self._location_batch_size = max(1, open_meteo_config['location_batch_size'])
+        self._locations = [Location(**location) for location in get_locations()]
+        self._openmeteo: Optional[openmeteo_requests.Client] = None
+
+        availability_config = get_field_availability_config()
+        self._availability = FieldAvailability(availability_config['path']) \
+            if availability_config['enabled'] else None
+
+    def get_forecasts(self, local_dt: datetime) -> list[ModelForecast]:
+        """Get the decoded forecasts of this run, shared with the other forecast sinks."""
+        return forecast_pipeline.get_forecasts(
+            local_dt, type(self).__name__, self._fetch_forecasts)
+
+    def _fetch_forecasts(self) -> list[ModelForecast]:
+        return [ModelForecast(response.model, extract_model_frame(response.response, response.hourly_fields),
+                              response.location)
+                for response in self.get_data_for_all_models()]
+
+    def _get_client(self) -> openmeteo_requests.Client:
+        # Requests go through the shared session, its connections are reused by all jobs
+        if self._openmeteo is None:
+            # Type ignore for the session type mismatch
+            self._openmeteo = openmeteo_requests.Client(
+                session=get_http_session("open_meteo"))  # type: ignore
+        return self._openmeteo
+
     def get_data_for_all_models(self) -> list[ModelResponse]:
+        openmeteo = self._get_client()
+
+        # The API accepts several comma separated coordinates and several models
+        # per request and answers with one response per location and model. All
+        # locations and models of a request get the same fields, so the models are
+        # grouped by the locations they have data for and the fields they provide.
+        chunks = []
+        for (locations, fields), models in self._plan_requests().items():
+            for i in range(0, len(locations), self._location_batch_size):
+                chunks.extend((list(locations[i:i + self._location_batch_size]),
+                               models[j:j + self._batch_size], list(fields))
+                              for j in range(0, len(models), self._batch_size))
+        deadline = time.monotonic() + self._deadline
+
+        executor = ThreadPoolExecutor(
+            max_workers=self._max_workers, thread_name_prefix="open-meteo")
+        try:
+            futures = [executor.submit(self._request_chunk, openmeteo, locations, chunk, fields, deadline)
+                       for locations, chunk, fields in chunks]
+            wait(futures, timeout=self._deadline)
+        finally:
+            # Do not wait for requests that are still running after the deadline
+            executor.shutdown(wait=False, cancel_futures=True)
+
         all_responses = []
-        latitude, longitude = get_coordinates()
-
-        cache_session = requests_cache.CachedSession(
-            '.cache', expire_after=3600)
-        retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-        # Type ignore for the session type mismatch
-        openmeteo = openmeteo_requests.Client(
-            session=retry_session)  # type: ignore
-        url = "https://api.open-meteo.com/v1/forecast"
+        for (locations, chunk, _), future in zip(chunks, futures):
+            if future.done() and not future.cancelled():
+                all_responses.extend(future.result())
+            else:
+                for model in chunk:
+                    self._report_model_error(model, TimeoutError(
+                        "Deadline of {}s for fetching all models exceeded".format(self._deadline)), locations)
+        return all_responses
+
+    def _plan_requests(self) -> dict[tuple[tuple[Location, ...], tuple[str, ...]], list[str]]:
+        """Group the models by the locations with data and the fields to request there."""
+        if self._availability is None or not self._availability.load():
+            return {(tuple(self._locations), tuple(self._hourly_fields)): list(self._models)}
+
+        groups: dict[tuple[tuple[Location, ...], tuple[str, ...]], list[str]] = {}
+        skipped: dict[str, list[str]] = {}
         for model in self._models:
-            params = {
-                "latitude": latitude,
-                "longitude": longitude,
-                "hourly": self._hourly_fields,
-                "timezone": "GMT",
-                "models": [model],
-                "forecast_days": 16
-            }
-
-            try:
-                responses = openmeteo.weather_api(url, params=params)
-                single_response = responses[0]
-                if single_response is None:
-                    raise Exception
-                res = ModelResponse(model, single_response)
-                all_responses.append(res)
-                print("Received data for model: {}".format(model))
-            except Exception as e:
-                print("Unable to request data for model ", model)
-                error_message = (
-                    f"**⚠️ Cronjob Warning**\n"
-                    f"**Time:** `{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}`\n"
-                    f"**Unable to request data for model `{model}`**\n"
-                    f"**Error message:**\n"
-                    f"```\n{str(e)}\n```"
-                )
-                if self._webhook is not None:
-                    self._webhook.send(error_message)
-                continue
+            locations = []
+            requested = set()
+            for location in self._locations:
+                # The key fields decide which rows are kept, they are always requested
+                fields = self._availability.fields_for(
+                    model, location.latitude, location.longitude, self._hourly_fields, KEY_FIELDS)
+                if fields is None:
+                    skipped.setdefault(location.name, []).append(model)
+                    continue
+                locations.append(location)
+                requested.update(fields)
+            if locations:
+                fields = tuple(field for field in self._hourly_fields if field in requested)
+                groups.setdefault((tuple(locations), fields), []).append(model)
+        for name, models in skipped.items():
+            print("Skipping models without data for location {}: {}".format(name, ", ".join(models)))
+        return groups
 
-        return all_responses
+    def _request_chunk(self, openmeteo: openmeteo_requests.Client, locations: list[Location], models: list[str],
+                       fields: list[str], deadline: float) -> list[ModelResponse]:
+        if len(models) == 1:
+            return self._request_single_model(openmeteo, locations, models[0], fields, deadline)
+
+        try:
+            responses = self._request_models(openmeteo, locations, models, fields, deadline)
+            print("Received data for models: {}{}".format(", ".join(models), self._describe(locations)))
+            return responses
+        except Exception as e:
+            # One broken model fails the whole chunk, so retry the models
+            # of this chunk one by one to keep the working ones
+            print("Unable to request data for models {}, falling back to single requests: {}".format(
+                ", ".join(models), e))
+            responses = []
+            for model in models:
+                responses.extend(
+                    self._request_single_model(openmeteo, locations, model, fields, deadline))
+            return responses
+
+    def _request_models(self, openmeteo: openmeteo_requests.Client, locations: list[Location], models: list[str],
+                        fields: list[str], deadline: float) -> list[ModelResponse]:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(
+                "Deadline of {}s for fetching all models exceeded".format(self._deadline))
+
+        url = "https://api.open-meteo.com/v1/forecast"
+        params = {
+            "latitude": ",".join(str(location.latitude) for location in locations),
+            "longitude": ",".join(str(location.longitude) for location in locations),
+            "hourly": fields,
+            "timezone": "GMT",
+            "models": models,
+            "forecast_days": 16
+        }
+
+        responses = openmeteo.weather_api(
+            url, params=params, timeout=min(self._request_timeout, remaining))
+        if len(responses) != len(locations) * len(models) or any(r is None for r in responses):
+            raise Exception("Expected {} responses, received {}".format(
+                len(locations) * len(models), len(responses)))
+
+        # The responses of a location keep the order of the requested models
+        per_location: list[list[WeatherApiResponse]] = [[] for _ in locations]
+        for response in responses:
+            location_id = response.LocationId()
+            if not 0 <= location_id < len(locations):
+                raise Exception("Response for unknown location {}".format(location_id))
+            per_location[location_id].append(response)
+        if any(len(location_responses) != len(models) for location_responses in per_location):
+            raise Exception("Expected {} responses per location, received {}".format(
+                len(models), [len(location_responses) for location_responses in per_location]))
+
+        return [ModelResponse(model, response, fields, location)
+                for location, location_responses in zip(locations, per_location)
+                for model, response in zip(models, location_responses)]
+
+    def _request_single_model(self, openmeteo: openmeteo_requests.Client, locations: list[Location], model: str,
+                              fields: list[str], deadline: float) -> list[ModelResponse]:
+        try:
+            res = self._request_models(openmeteo, locations, [model], fields, deadline)
+            print("Received data for model: {}{}".format(model, self._describe(locations)))
+            return res
+        except Exception as e:
+            if len(locations) == 1:
+                self._report_model_error(model, e, locations)
+                return []
+        # A location without data fails the whole request, keep the other locations
+        responses = []
+        for location in locations:
+            responses.extend(self._request_single_model(openmeteo, [location], model, fields, deadline))
+        return responses
+
+    @staticmethod
+    def _describe(locations: list[Location]) -> str:
+        if len(locations) == 1 and locations[0].primary:
+            return ""
+        return " at {}".format(", ".join(location.name for location in locations))
+
+    def _report_model_error(self, model: str, e: Exception, locations: list[Location]):
+        description = self._describe(locations)
+        print("Unable to request data for model {}{}".format(model, description))
+        error_message = (
+            f"**⚠️ Cronjob Warning**\n"
+            f"**Time:** `{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}`\n"
+            f"**Unable to request data for model `{model}`{description}**\n"
+            f"**Error message:**\n"
+            f"```\n{str(e)}\n```"
+        )
+        if self._webhook is not None:
+            self._webhook.send(error_message)
@@ -2,32 +2,62 @@ from datetime import datetime, timezone
 import os
 
 from cron.jobs.open_meteo.open_meteo_cronjob import OpenMeteoCronjob
-from cron.jobs.toDataFrame import extract_model_data
-from cron.settings_utils import get_data_dir
+from cron.jobs.open_meteo.forecast_pipeline import forecast_pipeline
+from cron.jobs.toDataFrame import format_model_data
+from cron.settings_utils import get_data_dir, get_archive_config
 
 
+@forecast_pipeline.register_sink
 class OpenMeteoCsvCronjob(OpenMeteoCronjob):
 
     def __init__(self):
         super().__init__()
+        self._lastArchiveFile = None
 
     def start(self, local_dt: datetime) -> bool:
+        self._lastDataDirectory = None
+        self._lastArchiveFile = None
         utc_dt = local_dt.astimezone(timezone.utc)
+
+        archive_config = get_archive_config()
+        if archive_config['format'] != 'csv':
+            return self._write_archive(utc_dt, local_dt, archive_config)
+
         data_dir = get_data_dir()
         data_directory = os.path.join(
             data_dir, utc_dt.strftime("%Y-%m-%dT%H-%M-%SZ"))
         if not os.path.exists(data_directory):
             os.makedirs(data_directory)
 
-        all_responses = self.get_data_for_all_models()
-        for response in all_responses:
-            model = response.model
-            df = extract_model_data(response.response, self._hourly_fields)
-            df.to_csv("{}/{}.csv".format(data_directory, model), index=False)
+        for forecast in self.get_forecasts(local_dt):
+            if self.isCancelled():
+                print("OpenMeteoCsvCronjob cancelled, remaining forecasts were not written")
+                return False
+            # The default location keeps the layout of the run directory,
+            # other locations get a subdirectory named after the location
+            directory = data_directory if forecast.location.primary \
+                else os.path.join(data_directory, forecast.location.name)
+            os.makedirs(directory, exist_ok=True)
+            df = format_model_data(forecast.data)
+            df.to_csv("{}/{}.csv".format(directory, forecast.model), index=False)
 
         self._lastDataDirectory = data_directory
         return True
 
+    def _write_archive(self, utc_dt: datetime, local_dt: datetime, archive_config: dict) -> bool:
+        # Imported here, pyarrow is only needed for the columnar formats
+        from cron.jobs.open_meteo.forecast_archive import write_archive_run
+
+        forecasts = self.get_forecasts(local_dt)
+        self._lastArchiveFile = write_archive_run(
+            archive_config['archive_dir'], utc_dt, forecasts, self._hourly_fields,
+            archive_format=archive_config['format'],
+            compression=archive_config['compression'])
+        print("Archived {} models to {}".format(len(forecasts), self._lastArchiveFile))
+        return True
+
     def cleanUpAfterError(self):
         if self._lastDataDirectory is not None:
             os.rmdir(self._lastDataDirectory)
+        if self._lastArchiveFile is not None and os.path.exists(self._lastArchiveFile):
+            os.remove(self._lastArchiveFile)
@@ -1,64 +1,114 @@
+import os
 from datetime import datetime, timezone
 
-import pandas as pd
-from influxdb_client.client.influxdb_client import InfluxDBClient
-from influxdb_client.client.write.point import Point
 from influxdb_client.domain.write_precision import WritePrecision
-from influxdb_client.client.write_api import SYNCHRONOUS
 
 from cron.jobs.open_meteo.open_meteo_cronjob import OpenMeteoCronjob
-from cron.jobs.toDataFrame import extract_model_data
-from cron.settings_utils import get_influx_config, get_coordinates
+from cron.jobs.open_meteo.forecast_pipeline import ModelForecast, forecast_pipeline
+from cron.jobs.open_meteo.forecast_snapshot import SnapshotStore, changed_fields
+from cron.jobs.open_meteo.forecast_schema import SCHEMA_LEAD_TIME, check_schema, encode_lead_time
+from cron.jobs.influx_writer import get_influx_writer
+from cron.jobs.line_protocol import encode_frame
+from cron.jobs.toDataFrame import format_dates
+from cron.settings_utils import get_influx_config, get_state_dir
 
 
+@forecast_pipeline.register_sink
 class OpenMeteoInfluxCronjob(OpenMeteoCronjob):
     def __init__(self):
         super().__init__()
-        influx_config = get_influx_config()
-        self.client = InfluxDBClient(
-            url=influx_config['url'],
-            token=influx_config['token'],
-            org=influx_config['org']
-        )
+        self.writer = get_influx_writer()
+        self._schema = check_schema(get_influx_config()['schema'])
+        self._snapshots = SnapshotStore(
+            os.path.join(get_state_dir(), "forecast_snapshots"))
 
     def start(self, local_dt: datetime) -> bool:
         utc_dt = local_dt.astimezone(timezone.utc)
         influx_config = get_influx_config()
-        latitude, longitude = get_coordinates()
+        delta_writes = influx_config['delta_writes']
+
+        forecasts = self.get_forecasts(local_dt)
+        for forecast in forecasts:
+            if self.isCancelled():
+                # Records handed to the writer so far are written when it is closed
+                print("OpenMeteoInfluxCronjob cancelled, remaining forecasts were not written")
+                return False
+            if delta_writes:
+                self._write_delta(forecast, utc_dt, influx_config['bucket'])
+            else:
+                self._write_forecast(forecast, forecast.data.drop(columns="date"),
+                                     utc_dt, influx_config['bucket'])
+                print("Wrote", len(forecast.data), "rows for", self._describe_forecast(forecast))
+        if self.writer.flush():
+            print(f"Successfully wrote {len(forecasts)} forecasts to InfluxDB")
+        else:
+            print("Error writing to InfluxDB, forecasts were spooled for the next run")
 
-        write_api = self.client.write_api(write_options=SYNCHRONOUS)
+        if delta_writes:
+            # Only remember the values once they were handed to the writer,
+            # failed writes are spooled and written by a later run
+            for forecast in forecasts:
+                self._snapshots.save(self._snapshot_key(forecast), forecast.data)
+        return True
 
-        all_responses = self.get_data_for_all_models()
-        for response in all_responses:
-            model = response.model
-            df = extract_model_data(response.response, self._hourly_fields)
+    @staticmethod
+    def _snapshot_key(forecast: ModelForecast) -> str:
+        # The default location keeps the snapshots written before there were several locations
+        if forecast.location.primary:
+            return forecast.model
+        return "{}@{}".format(forecast.model, forecast.location.name)
 
-            influx_data = []
+    @staticmethod
+    def _describe_forecast(forecast: ModelForecast) -> str:
+        if forecast.location.primary:
+            return forecast.model
+        return "{} at {}".format(forecast.model, forecast.location.name)
 
-            for index, row in df.iterrows():
-                point = Point("forecast")
-                point.time(utc_dt, WritePrecision.S)
-                point.tag("model", model)
-                point.tag("latitude", latitude)
-                point.tag("longitude", longitude)
-                point.tag("forecast_date", row["date"])
+    def _write_forecast(self, forecast: ModelForecast, fields, utc_dt: datetime, bucket: str) -> None:
+        latitude, longitude = forecast.location.latitude, forecast.location.longitude
+        if self._schema == SCHEMA_LEAD_TIME:
+            record = encode_lead_time(
+                dict(fields.items()), forecast.data["date"], utc_dt,
+                tags={"model": forecast.model, "latitude": latitude, "longitude": longitude})
+            self.writer.write(bucket, record, WritePrecision.S)
+            return
 
-                row = row.drop("date")
+        # NaN values are left out, this can happen if the model
+        # does not provide data for a field
+        record = encode_frame(
+            "forecast",
+            fields,
+            tags={
+                "model": forecast.model,
+                "latitude": latitude,
+                "longitude": longitude,
+                "forecast_date": format_dates(forecast.data["date"])
+            },
+            time=utc_dt,
+            precision=WritePrecision.S)
 
-                for key, value in row.items():
-                    if pd.isna(value):
-                        # skip NaN values
-                        # this can happen if the model does not provide data for this field
-                        continue
-                    point.field(key, value)
+        self.writer.write(bucket, record, WritePrecision.S)
 
-                influx_data.append(point)
+    def _write_delta(self, forecast: ModelForecast, utc_dt: datetime, bucket: str) -> None:
+        """Write the cells that changed since the last run and a marker for the run."""
+        fields, changed_cells = changed_fields(
+            forecast.data, self._snapshots.load(self._snapshot_key(forecast)))
+        if changed_cells > 0:
+            self._write_forecast(forecast, fields, utc_dt, bucket)
 
-            write_api.write(
-                bucket=influx_config['bucket'], org="FogCast", record=influx_data)
-            print("Wrote", len(influx_data), "rows for", model)
-        write_api.close()
-        return True
+        latitude, longitude = forecast.location.latitude, forecast.location.longitude
+        record = encode_frame(
+            "forecast_run",
+            {"changed_cells": [changed_cells], "rows": [len(forecast.data)]},
+            tags={
+                "model": forecast.model,
+                "latitude": latitude,
+                "longitude": longitude
+            },
+            time=utc_dt,
+            precision=WritePrecision.S)
+        self.writer.write(bucket, record, WritePrecision.S)
+        print("Wrote", changed_cells, "changed values for", self._describe_forecast(forecast))
 
     def cleanUpAfterError(self):
         pass
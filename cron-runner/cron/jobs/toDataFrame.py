@@ -1,32 +1,75 @@
+import numpy as np
 import pandas as pd
 from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
 
+# Fields that have to be forecasted for a row to be kept
+KEY_FIELDS = ["temperature_2m", "relative_humidity_2m", "dew_point_2m"]
 
-def toDataFrame(response: WeatherApiResponse, hourly_fields: list[str]):
+
+def _hourly_columns(response: WeatherApiResponse, hourly_fields: list[str]) -> dict:
     hourly = response.Hourly()
     if hourly is None:
         raise Exception
-    dates = pd.date_range(
-        start=pd.to_datetime(hourly.Time(), unit="s", utc=True),
-        end=pd.to_datetime(hourly.TimeEnd(), unit="s", utc=True),
-        freq=pd.Timedelta(seconds=hourly.Interval()),
-        inclusive="left",
-        tz="UTC",
-    )
-    dates = dates.map(lambda x: x.strftime("%Y-%m-%dT%H:%M:%SZ"))
-    hourly_data = {"date": dates}
+    timestamps = np.arange(hourly.Time(), hourly.TimeEnd(),
+                           hourly.Interval(), dtype=np.int64)
+    hourly_data = {"date": pd.to_datetime(timestamps, unit="s", utc=True)}
 
     for i, variable_key in enumerate(hourly_fields):
-        variable = hourly.Variables(i).ValuesAsNumpy()  # type: ignore
-        hourly_data[variable_key] = variable.tolist()
+        hourly_data[variable_key] = hourly.Variables(i).ValuesAsNumpy()  # type: ignore
+    return hourly_data
 
-    df = pd.DataFrame(data=hourly_data)
-    return df
 
+def toFrame(response: WeatherApiResponse, hourly_fields: list[str]) -> pd.DataFrame:
+    """
+    Convert the hourly data of a response into a typed data frame.
 
-def extract_model_data(response: WeatherApiResponse, hourly_fields: list[str]):
-    df = toDataFrame(response, hourly_fields)
+    The "date" column holds UTC datetimes, the variable columns are the float32
+    arrays of the response. The arrays are views on the flatbuffer of the response,
+    so the frame is built without copying the values and is read-only.
+    """
+    # copy=False keeps one block per column instead of consolidating them
+    return pd.DataFrame(data=_hourly_columns(response, hourly_fields), copy=False)
+
+
+def format_dates(dates: pd.Series) -> np.ndarray:
+    """Format UTC datetimes as "%Y-%m-%dT%H:%M:%SZ" strings."""
+    values = dates.to_numpy(dtype="datetime64[s]")
+    return np.char.add(np.datetime_as_string(values, unit="s"), "Z")
+
+
+def format_model_data(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert a typed frame into the text representation stored in the CSV files.
+
+    Dates become strings and the float32 values are widened to float64.
+    """
+    data = {"date": format_dates(df["date"])}
+    for column in df.columns[1:]:
+        data[column] = df[column].to_numpy(dtype=np.float64)
+    return pd.DataFrame(data=data, index=df.index)
+
+
+def toDataFrame(response: WeatherApiResponse, hourly_fields: list[str]):
+    return format_model_data(toFrame(response, hourly_fields))
+
+
+def extract_model_frame(response: WeatherApiResponse, hourly_fields: list[str]) -> pd.DataFrame:
+    hourly_data = _hourly_columns(response, hourly_fields)
     # Cut the dataframe when the most important values are not forecasted anymore (NaN)
-    df = df.dropna(
-        subset=["temperature_2m", "relative_humidity_2m", "dew_point_2m"])
-    return df
+    keep = np.logical_and.reduce([~np.isnan(hourly_data[key]) for key in KEY_FIELDS])
+    rows = np.flatnonzero(keep)
+    if len(rows) == len(keep):
+        return pd.DataFrame(data=hourly_data, copy=False)
+    if len(rows) > 0 and rows[-1] - rows[0] + 1 == len(rows):
+        # Usually only the tail is cut, slicing keeps the columns as views
+        selection = slice(rows[0], rows[-1] + 1)
+        index = pd.RangeIndex(rows[0], rows[-1] + 1)
+    else:
+        selection = keep
+        index = pd.Index(rows)
+    hourly_data = {key: values[selection] for key, values in hourly_data.items()}
+    return pd.DataFrame(data=hourly_data, index=index, copy=False)
+
+
+def extract_model_data(response: WeatherApiResponse, hourly_fields: list[str]):
+    return format_model_data(extract_model_frame(response, hourly_fields))
@@ -1,7 +1,8 @@
-import requests
 from enum import Enum
 import pandas as pd
 
+from cron.jobs.clients import get_http_session
+
 class PegelOnline:
     """
     Represents a system to interact with Pegel Online services.
@@ -37,18 +38,20 @@ class PegelOnline:
             station_uuid (str): The UUID of the station for which measurements are to be retrieved.
 
         Returns:
-            list: A list of measurement records for the specified time period.
+            DataFrame: The measurement records for the specified time period, with the
+            parsed UTC timestamps in the "time" column.
 
         Raises:
             ValueError: If the provided period format is incorrect or unrecognized.
         """
         base_url = f"https://www.pegelonline.wsv.de/webservices/rest-api/v2/stations/{station.value}/W/measurements.json?"
         url = base_url + f"start={period.value}"
-        response = requests.get(url, timeout=30)
+        response = get_http_session("pegel_online").get(url, timeout=30)
         if response.status_code == 200:
             df = pd.DataFrame(response.json())
             df['value'] = df['value'].astype(int)
-            df['date'] = pd.to_datetime(df['timestamp'], format='%Y-%m-%dT%H:%M:%S%z').dt.tz_convert('UTC').dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+            df['time'] = pd.to_datetime(df['timestamp'], format='%Y-%m-%dT%H:%M:%S%z').dt.tz_convert('UTC')
+            df['date'] = df['time'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
             return df
         else:
             raise ValueError(f"Failed to retrieve data for period {period}. Status code: {response.status_code}")
\ No newline at end of file
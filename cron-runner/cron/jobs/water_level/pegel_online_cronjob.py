@@ -1,10 +1,9 @@
 from datetime import datetime
 import pandas as pd
-import pytz
-from influxdb_client.client.influxdb_client import InfluxDBClient
-from influxdb_client.client.write.point import Point
-from influxdb_client.client.write_api import SYNCHRONOUS
+from influxdb_client.domain.write_precision import WritePrecision
 
+from cron.jobs.influx_writer import get_influx_writer
+from cron.jobs.line_protocol import encode_frame
 from cron.jobs.water_level.pegel_online import PegelOnline
 from cron.jobs.cronjob_base import CronjobBase
 from cron.settings_utils import get_influx_config
@@ -21,8 +20,7 @@ class PegelOnlineCronjob(CronjobBase):
             PegelOnline.Station.KONSTANZ_BODENSEE, 906, "Konstanz Bodensee")
 
         influx_config = get_influx_config()
-        self.client = InfluxDBClient(
-            url=influx_config["url"], token=influx_config["token"], org=influx_config["org"])
+        self.writer = get_influx_writer()
         self.bucket = influx_config["bucket"]
 
     def start(self, local_dt: datetime) -> bool:
@@ -44,13 +42,16 @@ class PegelOnlineCronjob(CronjobBase):
         pass
 
     def write_data_to_influxdb(self, df: pd.DataFrame, station_infos: tuple):
-        with self.client.write_api(write_options=SYNCHRONOUS) as write_api:
-            for index, row in df.iterrows():
-                point = Point("water_level") \
-                    .field("value", row["value"]) \
-                    .tag("unit", "cm") \
-                    .tag("station_id", station_infos[1]) \
-                    .tag("station_name", station_infos[2]) \
-                    .time(datetime.strptime(row["date"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=pytz.UTC))
-                write_api.write(bucket=self.bucket,
-                                org="FogCast", record=point)
+        # All measurements of a station are encoded at once and written in a single batch
+        record = encode_frame(
+            "water_level",
+            {"value": df["value"].to_numpy()},
+            tags={
+                "unit": "cm",
+                "station_id": station_infos[1],
+                "station_name": station_infos[2]
+            },
+            time=df["time"],
+            precision=WritePrecision.NS)
+        self.writer.write(self.bucket, record, WritePrecision.NS)
+        self.writer.flush()
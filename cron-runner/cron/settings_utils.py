@@ -1,6 +1,7 @@
 """
 Utility functions for safe settings access with type safety.
 """
+import os
 from typing import Any, TypeVar, Union
 from cron.settings import settings
 
@@ -69,13 +70,90 @@ def get_data_dir() -> str:
     """Get the data directory path."""
     return get_setting('data_dir', './csv-data')
 
+def get_state_dir() -> str:
+    """Get the directory for state kept between runs (snapshots, ...)."""
+    return get_setting('state_dir', './state')
+
+def get_archive_config() -> dict:
+    """Get the format of the forecast archive written by OpenMeteoCsvCronjob."""
+    return {
+        'format': get_setting('archive.format', 'csv'),
+        'compression': get_setting('archive.compression', 'zstd'),
+        'archive_dir': get_setting('archive.archive_dir', './archive')
+    }
+
 def get_influx_config() -> dict:
     """Get InfluxDB configuration."""
     return {
         'url': get_setting('influx.url', 'http://localhost:8086'),
         'token': get_setting('influx.token', ''),
         'org': get_setting('influx.org', ''),
-        'bucket': get_setting('influx.bucket', '')
+        'bucket': get_setting('influx.bucket', ''),
+        'batch_size': int(get_setting('influx.batch_size', 5000)),
+        'flush_interval': float(get_setting('influx.flush_interval', 10)),
+        'max_in_flight': int(get_setting('influx.max_in_flight', 2)),
+        'gzip': bool(get_setting('influx.gzip', True)),
+        'spool_dir': get_setting('influx.spool_dir', './spool'),
+        'delta_writes': bool(get_setting('influx.delta_writes', False)),
+        'schema': get_setting('influx.schema', 'issue_time'),
+        'query_timeout': float(get_setting('influx.query_timeout', 300))
+    }
+
+def get_scheduler_config() -> dict:
+    """Get job scheduler configuration."""
+    return {
+        'max_workers': int(get_setting('scheduler.max_workers', 1)),
+        'job_timeout': float(get_setting('scheduler.job_timeout', 3300)),
+        'cancel_grace': float(get_setting('scheduler.cancel_grace', 60)),
+        'import_budget_ms': float(get_setting('scheduler.import_budget_ms', 200))
+    }
+
+def get_open_meteo_config() -> dict:
+    """Get Open-Meteo request configuration."""
+    return {
+        'batch_size': int(get_setting('open_meteo.batch_size', 1)),
+        'max_workers': int(get_setting('open_meteo.max_workers', 1)),
+        'request_timeout': float(get_setting('open_meteo.request_timeout', 60)),
+        'deadline': float(get_setting('open_meteo.deadline', 900)),
+        'location_batch_size': int(get_setting('open_meteo.location_batch_size', 10))
+    }
+
+def get_http_config() -> dict:
+    """Get the configuration of the shared HTTP session and its response cache."""
+    cache_ttl = {'open_meteo': 3600, 'open_meteo_measured': 0, 'pegel_online': 300}
+    configured_ttl = get_setting('http.cache_ttl', None)
+    if configured_ttl is not None:
+        cache_ttl.update({endpoint: float(ttl) for endpoint, ttl in vars(configured_ttl).items()})
+    return {
+        'cache_backend': get_setting('http.cache_backend', 'sqlite'),
+        'cache_dir': get_setting('http.cache_dir', os.path.join(get_state_dir(), 'http_cache')),
+        'memory_max_entries': int(get_setting('http.memory_max_entries', 256)),
+        'cache_ttl': cache_ttl,
+        'pool_maxsize': int(get_setting('http.pool_maxsize', 10)),
+        # open_meteo.retries was the setting before all requests shared one session
+        'retries': int(get_setting('http.retries', get_setting('open_meteo.retries', 3)))
+    }
+
+def get_field_availability_config() -> dict:
+    """Get the configuration of the model/field availability matrix."""
+    return {
+        'enabled': bool(get_setting('field_availability.enabled', True)),
+        'refresh_days': float(get_setting('field_availability.refresh_days', 7)),
+        'path': os.path.join(get_state_dir(), 'field_availability.json')
+    }
+
+def get_benchmark_config() -> dict:
+    """Get the benchmark configuration."""
+    return {
+        'incremental': bool(get_setting('benchmark.incremental', False)),
+        'source': get_setting('benchmark.source', 'influx'),
+        'memory_limit_mb': int(get_setting('benchmark.memory_limit_mb', 1024))
+    }
+
+def get_ground_truth_config() -> dict:
+    """Get the configuration of the measured values store used by the benchmark."""
+    return {
+        'refresh_hours': int(get_setting('ground_truth.refresh_hours', 2))
     }
 
 def get_discord_webhook_url() -> str:
@@ -88,3 +166,19 @@ def get_coordinates() -> tuple:
         get_setting('latitude', 0.0),
         get_setting('longitude', 0.0)
     )
+
+def get_locations() -> list[dict]:
+    """
+    Get the locations forecasts are collected for. The first one is the location of
+    `latitude`/`longitude` ("default"), followed by the entries of `locations`.
+    """
+    latitude, longitude = get_coordinates()
+    locations = [{'name': 'default', 'latitude': latitude, 'longitude': longitude, 'primary': True}]
+    for location in get_setting('locations', []) or []:
+        locations.append({
+            'name': str(location['name']),
+            'latitude': float(location['latitude']),
+            'longitude': float(location['longitude']),
+            'primary': False
+        })
+    return locations
@@ -0,0 +1,98 @@
+"""
+Benchmark of the forecast scoring in BenchmarkingService.calculate_error.
+
+Compares the previous implementation (merge, groupby with a lambda for the
+RMSE, row-wise apply for the metric selection) with the vectorized engine in
+cron.jobs.model_benchmarking.error_engine on synthetic frames with millions of
+rows, shaped like the 7 day benchmark query.
+
+    python dev/bench_error_engine.py [issue_hours]
+"""
+import sys
+import timeit
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from cron.jobs.model_benchmarking.benchmarking import BenchmarkingService, MEASURED_FIELDS
+from cron.jobs.model_benchmarking.error_engine import score_forecasts
+
+MODELS = 37
+LEAD_HOURS = 48
+END = datetime(2025, 3, 30, 5, tzinfo=timezone.utc)
+
+
+def make_frames(rng: np.random.Generator, issue_hours: int) -> tuple[pd.DataFrame, pd.DataFrame]:
+    end = pd.Timestamp(END)
+    hours = pd.date_range(end - pd.Timedelta(hours=issue_hours), end, freq="h", inclusive="left")
+    measured_hours = pd.date_range(hours[0] - pd.Timedelta(days=1), end + pd.Timedelta(days=1), freq="h")
+    measured = pd.DataFrame({
+        "date": np.tile(measured_hours, len(MEASURED_FIELDS)),
+        "_field": np.repeat(MEASURED_FIELDS, len(measured_hours)),
+        "actual_value": rng.normal(10, 5, len(measured_hours) * len(MEASURED_FIELDS)).astype(np.float32),
+    })
+
+    issue, lead, model, field = np.meshgrid(
+        np.arange(issue_hours), np.arange(LEAD_HOURS), np.arange(MODELS), np.arange(len(MEASURED_FIELDS)),
+        indexing="ij")
+    issue, lead, model, field = issue.ravel(), lead.ravel(), model.ravel(), field.ravel()
+    target = hours[issue] + pd.to_timedelta(lead, unit="h")
+    # Only forecasts for dates up to the end of the window are queried
+    keep = target <= end
+    forecasts = pd.DataFrame({
+        "_time": hours[issue[keep]],
+        "forecast_date": target[keep].strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "model": np.array([f"model_{i}" for i in range(MODELS)])[model[keep]],
+        "_value": rng.normal(10, 5, keep.sum()),
+        "_field": np.array(MEASURED_FIELDS)[field[keep]],
+    })
+    return forecasts, measured
+
+
+def legacy_calculate_error(df_forecasts, df_measured, forecast_date, lead_time):
+    df_forecasts["forecast_date"] = pd.to_datetime(df_forecasts["forecast_date"], utc=True)
+    df_measured["date"] = pd.to_datetime(df_measured["date"], utc=True)
+    merged_df = df_forecasts.merge(
+        df_measured, left_on=["forecast_date", "_field"], right_on=["date", "_field"], how="inner")
+    merged_df['abs_error'] = (merged_df['_value'] - merged_df['actual_value']).abs()
+    merged_df['squared_error'] = (merged_df['_value'] - merged_df['actual_value']) ** 2
+    error_df = merged_df.groupby(["model", "_field"]).agg(
+        mae=('abs_error', 'mean'),
+        mse=('squared_error', 'mean'),
+        rmse=('squared_error', lambda x: (x.mean())**0.5),
+    ).reset_index()
+    error_df["selected_error"] = error_df.apply(
+        lambda row: row["mae"] if row["_field"] in ["relative_humidity_2m", "cloud_cover"] else row["rmse"],
+        axis=1)
+    pivot_df = error_df.pivot_table(index=["model"], columns="_field", values="selected_error").reset_index()
+    pivot_df["lead_time"] = lead_time
+    pivot_df["forecast_date"] = forecast_date
+    return pivot_df
+
+
+def main():
+    issue_hours = int(sys.argv[1]) if len(sys.argv) > 1 else 168
+    rng = np.random.default_rng(42)
+    forecasts, measured = make_frames(rng, issue_hours)
+    service = BenchmarkingService.__new__(BenchmarkingService)
+
+    legacy = legacy_calculate_error(forecasts.copy(), measured.copy(), END, "l")
+    current = service.calculate_error(forecasts.copy(), measured.copy(), END, "l")
+    pd.testing.assert_frame_equal(legacy, current, check_exact=False, rtol=1e-12)
+
+    candidates = {
+        "legacy calculate_error": lambda: legacy_calculate_error(forecasts.copy(), measured.copy(), END, "l"),
+        "calculate_error": lambda: service.calculate_error(forecasts.copy(), measured.copy(), END, "l"),
+        "score_forecasts": lambda: score_forecasts(forecasts, measured),
+    }
+    print(f"{len(forecasts):,} forecast rows, {MODELS} models x {len(MEASURED_FIELDS)} fields")
+    baseline = None
+    for name, fn in candidates.items():
+        seconds = min(timeit.repeat(fn, number=1, repeat=3))
+        baseline = baseline or seconds
+        print(f"{name:<28} {seconds * 1000:8.1f} ms  {baseline / seconds:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Peak memory of the benchmark with the whole query result in memory versus the
+streaming read in BenchmarkingService.run_streaming_benchmark.
+
+A fake query API generates the Flux tables of a 7 day query on the fly, so the
+forecasts are never held in memory by the benchmark itself. Every mode runs in
+its own process and reports the peak RSS of that process.
+
+    python dev/bench_streaming_benchmark.py [models]
+"""
+import subprocess
+import sys
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from cron.jobs.model_benchmarking.benchmarking import BenchmarkingService, MEASURED_FIELDS, peak_memory_mb
+
+LEAD_HOURS = 168
+ISSUE_HOURS = 168
+END = pd.Timestamp("2025-03-30T05:00:00Z")
+
+
+class FakeQueryApi:
+    """Yields one table per run and model, like query_data_frame_stream"""
+
+    def __init__(self, models: int) -> None:
+        self._models = models
+
+    def query_data_frame_stream(self, query):
+        rng = np.random.default_rng(0)
+        fields = np.repeat(MEASURED_FIELDS, LEAD_HOURS)
+        for issue in pd.date_range(END - pd.Timedelta(hours=ISSUE_HOURS), END, freq="h", inclusive="left"):
+            dates = pd.date_range(issue, periods=LEAD_HOURS, freq="h")
+            dates = np.tile(dates[dates <= END].strftime("%Y-%m-%dT%H:%M:%SZ"), len(MEASURED_FIELDS))
+            for model in range(self._models):
+                yield pd.DataFrame({
+                    "result": "_result",
+                    "table": 0,
+                    "_time": issue,
+                    "forecast_date": dates,
+                    "model": f"model_{model}",
+                    "_value": rng.normal(10, 5, len(dates)),
+                    "_field": fields[:len(dates)],
+                })
+
+
+class FakeClient:
+    def __init__(self, models: int) -> None:
+        self._models = models
+
+    def query_api(self):
+        return FakeQueryApi(self._models)
+
+
+def run(mode: str, models: int, chunk_rows: int) -> None:
+    service = BenchmarkingService.__new__(BenchmarkingService)
+    service.source = "influx"
+    service.schema = "issue_time"
+    service.forecastBucket = "WeatherForecast"
+    service.client = FakeClient(models)
+    service.chunk_rows = chunk_rows
+    hours = pd.date_range(END - pd.Timedelta(days=8), END, freq="h")
+    measured = pd.DataFrame({
+        "date": np.tile(hours, len(MEASURED_FIELDS)),
+        "_field": np.repeat(MEASURED_FIELDS, len(hours)),
+        "actual_value": np.random.default_rng(1).normal(10, 5, len(hours) * len(MEASURED_FIELDS)),
+    })
+    start = END - timedelta(days=7)
+    horizons = [
+        ("short-term", "24 hours", [f"model_{i}" for i in range(models)], 1, "s"),
+        ("medium-term", "3 days", [f"model_{i}" for i in range(models)], 3, "m"),
+        ("long-term", "7 days", [f"model_{i}" for i in range(models)], 7, "l"),
+    ]
+    service.get_measured = lambda start_time, end_time: measured
+    service.write_data_to_influxdb = lambda df: None
+    service.write_error_curves = lambda curves, run_time: None
+
+    baseline = peak_memory_mb()
+    if mode == "full":
+        df = service.get_forecasts(start, END, [f"model_{i}" for i in range(models)])
+        rows = len(df)
+        for _, _, horizon_models, days, lead_time in horizons:
+            horizon = service.select_horizon(df, horizon_models, END - timedelta(days=days), END)
+            service.calculate_error(horizon, measured, END, lead_time)
+        service.calculate_error_curves(df, measured)
+    else:
+        rows = sum(len(chunk) for chunk in service.iter_forecasts(start, END, []))
+        service.run_streaming_benchmark(END, start, [], horizons)
+    print(f"{mode},{rows},{baseline:.0f},{peak_memory_mb():.0f}")
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--run":
+        run(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+        return
+
+    models = int(sys.argv[1]) if len(sys.argv) > 1 else 17
+    print(f"{models} models, {ISSUE_HOURS} runs")
+    for mode, chunk_rows in [("full", 0), ("stream", 250_000), ("stream", 1_000_000)]:
+        output = subprocess.run(
+            [sys.executable, __file__, "--run", mode, str(models), str(chunk_rows)],
+            capture_output=True, text=True, check=True).stdout.strip().splitlines()[-1]
+        _, rows, baseline, peak = output.split(",")
+        extra = int(peak) - int(baseline)
+        label = mode if mode == "full" else f"stream {chunk_rows:,} rows"
+        print(f"{label:<26} {int(rows):>10,} rows  peak {int(peak):5d} MB  "
+              f"+{extra:5d} MB  {extra * 2**20 / int(rows if mode == 'full' else chunk_rows):6.0f} B/row")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Micro-benchmark for converting Open-Meteo responses into data frames.
+
+Compares the previous implementation (strftime per hour, values converted with
+.tolist()) with the vectorized conversion in cron.jobs.toDataFrame on synthetic
+responses of the size the hourly job receives.
+
+    python dev/bench_to_dataframe.py
+"""
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from cron.jobs.toDataFrame import extract_model_data, extract_model_frame
+
+HOURS = 384
+FIELDS = 52
+MODELS = 32
+
+
+class FakeVariable:
+    def __init__(self, values: bytes):
+        self._values = values
+
+    def ValuesAsNumpy(self):
+        # Same as the flatbuffer accessor: a read-only view on the response buffer
+        return np.frombuffer(self._values, dtype=np.float32)
+
+
+class FakeHourly:
+    def __init__(self, start: int, variables: list[FakeVariable]):
+        self._start = start
+        self._variables = variables
+
+    def Time(self):
+        return self._start
+
+    def TimeEnd(self):
+        return self._start + HOURS * 3600
+
+    def Interval(self):
+        return 3600
+
+    def Variables(self, i):
+        return self._variables[i]
+
+
+class FakeResponse:
+    def __init__(self, hourly: FakeHourly):
+        self._hourly = hourly
+
+    def Hourly(self):
+        return self._hourly
+
+
+def make_response(rng: np.random.Generator, fields: list[str]) -> FakeResponse:
+    values = rng.normal(10, 5, size=(len(fields), HOURS)).astype(np.float32)
+    # Models stop forecasting after a few days
+    values[:, rng.integers(72, HOURS):] = np.nan
+    variables = [FakeVariable(row.tobytes()) for row in values]
+    return FakeResponse(FakeHourly(1760659200, variables))
+
+
+def legacy_extract_model_data(response, hourly_fields: list[str]):
+    hourly = response.Hourly()
+    dates = pd.date_range(
+        start=pd.to_datetime(hourly.Time(), unit="s", utc=True),
+        end=pd.to_datetime(hourly.TimeEnd(), unit="s", utc=True),
+        freq=pd.Timedelta(seconds=hourly.Interval()),
+        inclusive="left",
+        tz="UTC",
+    )
+    dates = dates.map(lambda x: x.strftime("%Y-%m-%dT%H:%M:%SZ"))
+    hourly_data = {"date": dates}
+    for i, variable_key in enumerate(hourly_fields):
+        hourly_data[variable_key] = hourly.Variables(i).ValuesAsNumpy().tolist()
+    df = pd.DataFrame(data=hourly_data)
+    return df.dropna(subset=["temperature_2m", "relative_humidity_2m", "dew_point_2m"])
+
+
+def main():
+    rng = np.random.default_rng(42)
+    fields = pd.read_csv("config/hourly_fields.csv")["field"].tolist()
+    responses = [make_response(rng, fields) for _ in range(MODELS)]
+
+    for response in responses:
+        pd.testing.assert_frame_equal(
+            legacy_extract_model_data(response, fields), extract_model_data(response, fields))
+
+    candidates = {
+        "legacy extract_model_data": lambda: [legacy_extract_model_data(r, fields) for r in responses],
+        "extract_model_data": lambda: [extract_model_data(r, fields) for r in responses],
+        "extract_model_frame": lambda: [extract_model_frame(r, fields) for r in responses],
+    }
+    print(f"{MODELS} models x {FIELDS} fields x {HOURS} hours")
+    baseline = None
+    for name, fn in candidates.items():
+        seconds = min(timeit.repeat(fn, number=1, repeat=5))
+        baseline = baseline or seconds
+        print(f"{name:<28} {seconds * 1000:8.1f} ms  {baseline / seconds:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()